@@ -1,30 +1,132 @@
-const unsigned long TS_US = 200;
-const unsigned short MAX_BUF_SIZE = 2501; //2500 samples plus 1 sync
-const unsigned short BUF_LEN_BYTES = MAX_BUF_SIZE * sizeof(unsigned short);
+//Samples are sent in packed frames, see Frame_Decoder.py:
+//  sync (4 bytes), frame number (uint16), number of samples (uint16),
+//  4 samples in every 5 bytes (4 low bytes then the high 2 bits of each),
+//  16 bit sum of the packed bytes
+//Nothing is sent until the host sends a config (sample period, chunk size and
+//baud rate), which is acked at DEFAULT_BAUD before switching baud rate
+const unsigned long DEFAULT_BAUD = 115200;
+const unsigned long MIN_TS_US = 40;
+const unsigned long ADC_MARGIN_US = 20; //time left after a conversion to pack and send the sample
 const unsigned char SAMPLE_PIN = A5;
+const byte SYNC[4] = {0xA5, 0x5A, 'D', 'P'};
+const byte CONFIG_MAGIC[4] = {'D', 'C', 'F', 'G'};
+const byte ACK_MAGIC[4] = {'D', 'A', 'C', 'K'};
+const byte NAK_MAGIC[4] = {'D', 'N', 'A', 'K'};
+const byte CONFIG_LEN = 14; //magic, ts_us (uint32), chunk_size (uint16), baud (uint32)
+
+unsigned long ts_us = 200;
+unsigned short chunk_size = 2500;
+bool configured = false;
 
-unsigned long cur_time;  //Will overflow after 1.2 hours
 unsigned long prev_time = 0;
-unsigned short cur_idx = 1;
-unsigned short buf[MAX_BUF_SIZE];
+unsigned short cur_idx = 0;
+unsigned short frame_num = 0;
+unsigned short check_sum = 0;
+byte group[5];
+byte config[CONFIG_LEN];
+byte config_len = 0;
 
 void setup()
 {
-  Serial.begin(115200);
-  buf[0] = (unsigned short) -1; //sync
+  Serial.begin(DEFAULT_BAUD);
+}
+
+//Uses the slowest ADC clock whose conversion (13 ADC clocks) fits in the
+//sample period. Full 10 bit accuracy needs a 50-200 kHz ADC clock, which is
+//the default divide by 128 (104 us per conversion at 16 MHz), so faster
+//clocks (down to divide by 16) trade accuracy for shorter sample periods
+void set_adc_clock(unsigned long period_us)
+{
+  byte bits = 7;
+  while (bits > 4 && 13UL * (1UL << bits) * 1000000UL / F_CPU + ADC_MARGIN_US > period_us) {
+    bits--;
+  }
+  ADCSRA = (ADCSRA & 0xF8) | bits;
+}
+
+void start_frame()
+{
+  Serial.write(SYNC, sizeof(SYNC));
+  Serial.write((byte *) &frame_num, sizeof(frame_num));
+  Serial.write((byte *) &chunk_size, sizeof(chunk_size));
+  cur_idx = 0;
+  check_sum = 0;
+  group[4] = 0;
+}
+
+void apply_config()
+{
+  unsigned long new_ts_us;
+  unsigned short new_chunk_size;
+  unsigned long new_baud;
+  memcpy(&new_ts_us, config + 4, sizeof(new_ts_us));
+  memcpy(&new_chunk_size, config + 8, sizeof(new_chunk_size));
+  memcpy(&new_baud, config + 10, sizeof(new_baud));
+
+  //Packed bytes plus frame overhead must fit in the link (10 bits per byte)
+  float bytes_per_sec = (1.25 * new_chunk_size + 10) * 1e6 / ((float) new_chunk_size * new_ts_us);
+  bool ok = new_ts_us >= MIN_TS_US && new_chunk_size > 0 && new_chunk_size % 4 == 0 &&
+    bytes_per_sec < new_baud / 10.0;
+
+  Serial.write(ok ? ACK_MAGIC : NAK_MAGIC, 4);
+  Serial.write(config + 4, CONFIG_LEN - 4);
+  Serial.flush();
+  if (ok) {
+    ts_us = new_ts_us;
+    chunk_size = new_chunk_size;
+    set_adc_clock(ts_us);
+    Serial.end();
+    Serial.begin(new_baud);
+    configured = true;
+    start_frame();
+    prev_time = micros();
+  }
+}
+
+void read_config()
+{
+  while (Serial.available()) {
+    byte b = Serial.read();
+    if (config_len < sizeof(CONFIG_MAGIC) && b != CONFIG_MAGIC[config_len]) {
+      //Start over, this byte may begin the next config
+      config_len = 0;
+      if (b != CONFIG_MAGIC[0]) {
+        continue;
+      }
+    }
+    config[config_len++] = b;
+    if (config_len == CONFIG_LEN) {
+      config_len = 0;
+      apply_config();
+    }
+  }
 }
 
 void loop()
 {
-  cur_time = micros();
-  if ((cur_time - prev_time) >= TS_US) {
-    buf[cur_idx] = (unsigned short) analogRead(SAMPLE_PIN);
+  read_config();
+  if (!configured) {
+    return;
+  }
+
+  if ((micros() - prev_time) >= ts_us) {
+    prev_time += ts_us;
+    unsigned short sample = (unsigned short) analogRead(SAMPLE_PIN);
+    byte k = cur_idx & 3;
+    group[k] = sample & 0xFF;
+    group[4] |= (sample >> 8) << (2 * k);
     cur_idx++;
-    if (cur_idx >= MAX_BUF_SIZE) {
-      Serial.write((byte *) buf, BUF_LEN_BYTES);
-      cur_idx = 1;
-      buf[0] = (unsigned short) -1; //sync
+    if (k == 3) {
+      Serial.write(group, sizeof(group));
+      for (byte ii = 0; ii < sizeof(group); ii++) {
+        check_sum += group[ii];
+      }
+      group[4] = 0;
+    }
+    if (cur_idx >= chunk_size) {
+      Serial.write((byte *) &check_sum, sizeof(check_sum));
+      frame_num++;
+      start_frame();
     }
-    prev_time = cur_time;
   }
 }
@@ -0,0 +1,338 @@
+#Imports
+import os
+import pty
+import tty
+import time
+import select
+import threading
+import collections
+import numpy as np
+from Raw_Recording import load_recording
+from Frame_Decoder import pack_frame, legacy_frame, CONFIG, CONFIG_MAGIC, ACK_MAGIC, NAK_MAGIC, DEFAULT_BAUD
+
+#Same limit as the arduino code
+MIN_TS_US = 40
+
+################################################################################
+class Arduino_Emulator:
+	"""
+	Pretends to be the arduino on a pseudo terminal, sending a recording (or a
+	test tone) with the same framing as the arduino code
+	"""
+	def __init__(self, savefile=None, ts_us=200, chunk_size=2500, rate=1.0, loss=0.0, legacy=False, tone_hz=500.0, seed=None):
+		"""
+		PURPOSE: creates a new Arduino_Emulator
+		ARGS:
+			savefile (str): recording to send (anything load_recording opens),
+				if None sends a test tone
+			ts_us (int): sampling period (microseconds), the host can change
+				this when it connects unless legacy is True
+			chunk_size (int): number of samples per frame, the host can change
+				this when it connects unless legacy is True
+			rate (float): sending speed as a multiple of real time, 0 or None
+				sends as fast as the host reads
+			loss (float): chance of each byte being lost
+			legacy (bool): if True acts like the original arduino code, legacy
+				frames sent without waiting for a config
+			tone_hz (float): frequency of the test tone
+			seed (int): random seed for the test tone noise and byte loss
+		RETURNS: new instance of an Arduino_Emulator
+		NOTES: point Chunked_Arduino_ADC at 'port'. Bytes the host is not
+			reading fast enough are lost like a real serial port
+		"""
+		#Save arguments
+		self.ts_us = int(ts_us)
+		self.chunk_size = int(chunk_size)
+		self.rate = rate
+		self.loss = loss
+		self.legacy = legacy
+		self.tone_hz = tone_hz
+		self.rng = np.random.RandomState(seed)
+		self.baud = DEFAULT_BAUD
+		self.data = None
+		if savefile != None:
+			self.ts_us, self.chunk_size, self.data = load_recording(savefile, lazy=True)
+			self.ts_us = int(self.ts_us)
+			self.chunk_size = int(self.chunk_size)
+
+		#Open the pseudo terminal, we keep our end of the slave open so the
+		#host can come and go
+		self.master_fd, self.slave_fd = pty.openpty()
+		tty.setraw(self.slave_fd)
+		self.port = os.ttyname(self.slave_fd)
+		self.rx = bytearray()
+
+		#Setup thread variables
+		self.emu_thread = None
+		self.emu_keep_going = threading.Event()
+		self.emu_keep_going.clear()
+		self.emu_wake = threading.Event()
+
+		#Status variables
+		self.configured = legacy
+		self.frames_sent = 0
+		self.bytes_sent = 0
+		self.bytes_lost = 0
+		self.bytes_overflowed = 0
+		self.send_times = collections.deque(maxlen=256)
+
+	############################################################################
+	def __del__(self):
+		"""
+		PURPOSE: performs any necessary cleanup
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.stop()
+		for fd in [getattr(self, "master_fd", None), getattr(self, "slave_fd", None)]:
+			if fd != None:
+				os.close(fd)
+		self.master_fd = None
+		self.slave_fd = None
+
+	############################################################################
+	def start(self):
+		"""
+		PURPOSE: starts the emulator thread
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		if self.emu_thread == None or not self.is_running():
+			self.emu_wake.clear()
+			self.emu_thread = threading.Thread(target = self.run)
+			self.emu_thread.start()
+
+	############################################################################
+	def stop(self):
+		"""
+		PURPOSE: stops the emulator thread
+		ARGS: none
+		RETURNS: none
+		NOTES: blocks until thread stops
+		"""
+		if self.emu_thread:
+			self.emu_keep_going.clear()
+			self.emu_wake.set()
+			self.emu_thread.join()
+			self.emu_thread = None
+
+	############################################################################
+	def is_running(self):
+		"""
+		PURPOSE: checks if the emulator thread is running
+		ARGS: none
+		RETURNS: True if running, False if stopped
+		NOTES:
+		"""
+		return self.emu_keep_going.is_set()
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the status of this thread
+		ARGS: none
+		RETURNS: dictionary of statuses
+		NOTES:
+		"""
+		status = {
+			"running" : self.is_running(),
+			"configured" : self.configured,
+			"ts_us" : self.ts_us,
+			"chunk_size" : self.chunk_size,
+			"baud" : self.baud,
+			"frames_sent" : self.frames_sent,
+			"bytes_sent" : self.bytes_sent,
+			"bytes_lost" : self.bytes_lost,
+			"bytes_overflowed" : self.bytes_overflowed
+		}
+		return status
+
+	############################################################################
+	def read_config(self):
+		"""
+		PURPOSE: handles any config the host sent
+		ARGS: none
+		RETURNS: True if a new config was accepted
+		NOTES: replies with an ack or nak like the arduino code
+		"""
+		accepted = False
+		while select.select([self.master_fd], [], [], 0)[0]:
+			try:
+				data = os.read(self.master_fd, 4096)
+			except OSError as e:
+				#Nobody has the port open
+				break
+			if not data:
+				break
+			self.rx += data
+		while True:
+			pos = self.rx.find(CONFIG_MAGIC)
+			if pos < 0:
+				del self.rx[:-len(CONFIG_MAGIC)]
+				return accepted
+			if len(self.rx) - pos < CONFIG.size:
+				del self.rx[:pos]
+				return accepted
+			config = bytes(self.rx[pos:pos+CONFIG.size])
+			del self.rx[:pos+CONFIG.size]
+			if self.legacy:
+				continue
+			ts_us, chunk_size, baud = CONFIG.unpack(config)[1:]
+			bytes_per_sec = (1.25 * chunk_size + 10) * 1e6 / (chunk_size * ts_us) if chunk_size and ts_us else float("inf")
+			ok = ts_us >= MIN_TS_US and chunk_size > 0 and chunk_size % 4 == 0 and bytes_per_sec < baud / 10
+			self.write((ACK_MAGIC if ok else NAK_MAGIC) + config[4:])
+			if ok:
+				self.ts_us = ts_us
+				self.chunk_size = chunk_size
+				self.baud = baud
+				self.configured = True
+				accepted = True
+
+	############################################################################
+	def write(self, data):
+		"""
+		PURPOSE: sends bytes to the host
+		ARGS:
+			data (bytes): bytes to send
+		RETURNS: none
+		NOTES: bytes that do not fit in the terminal buffer are lost
+		"""
+		view = memoryview(data)
+		while len(view):
+			if not select.select([], [self.master_fd], [], 0.05)[1]:
+				self.bytes_overflowed += len(view)
+				return
+			num = os.write(self.master_fd, view)
+			view = view[num:]
+			self.bytes_sent += num
+
+	############################################################################
+	def get_counts(self, frame_num):
+		"""
+		PURPOSE: gets the adc counts to send in a frame
+		ARGS:
+			frame_num (int): number of frames sent before this one
+		RETURNS: numpy array of 10 bit adc counts
+		NOTES: recordings loop, volts are converted back to counts
+		"""
+		if self.data is None:
+			t = (frame_num * self.chunk_size + np.arange(self.chunk_size)) * self.ts_us / 1e6
+			volts = 2.5 + 1.5 * np.sin(2 * np.pi * self.tone_hz * t) + self.rng.normal(0, 0.05, self.chunk_size)
+		else:
+			num_chunks = len(self.data) // self.chunk_size
+			ii = frame_num % num_chunks
+			volts = np.asarray(self.data[self.chunk_size*ii:self.chunk_size*(ii+1)])
+			if volts.dtype == np.uint16:
+				return volts
+		return np.clip(np.round(volts / 5 * 1023), 0, 1023).astype(np.uint16)
+
+	############################################################################
+	def run(self):
+		"""
+		PURPOSE: sends frames
+		ARGS: none
+		RETURNS: none
+		NOTES: calling 'start' runs this in a separate thread
+		"""
+		#Indicate thread is running
+		self.emu_keep_going.set()
+
+		try:
+			num_sent = 0
+			start_time = None
+			while self.is_running():
+				#A new config starts the stream over
+				if self.read_config():
+					num_sent = 0
+					start_time = None
+				if not self.configured:
+					self.emu_wake.wait(0.01)
+					continue
+				if start_time == None:
+					start_time = time.perf_counter()
+
+				#Wait until this frame has been sampled, checking for configs
+				if self.rate:
+					delay = start_time + (num_sent + 1) * self.chunk_size * self.ts_us / 1e6 / self.rate - time.perf_counter()
+					if delay > 0:
+						self.emu_wake.wait(min(delay, 0.05))
+						continue
+
+				#Make the frame and lose some bytes
+				counts = self.get_counts(num_sent)
+				if self.legacy:
+					frame = legacy_frame(counts)
+				else:
+					frame = pack_frame(num_sent, counts)
+				if self.loss:
+					keep = self.rng.random_sample(len(frame)) >= self.loss
+					self.bytes_lost += len(frame) - int(keep.sum())
+					frame = np.frombuffer(frame, dtype=np.uint8)[keep].tobytes()
+				self.write(frame)
+				self.send_times.append((num_sent & 0xFFFF, time.perf_counter()))
+				self.frames_sent += 1
+				num_sent += 1
+		except Exception as e:
+			print("ERROR: 'emulator thread' got exception %s" % type(e))
+			print(e)
+			self.emu_keep_going.clear()
+
+		self.emu_keep_going.clear()
+
+	############################################################################
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+	import queue
+
+	parser = argparse.ArgumentParser(description="Emulate the arduino on a pseudo terminal")
+	parser.add_argument("savefile", type=str, nargs="?", help="Recording to send, sends a test tone if not given", default=None)
+	parser.add_argument("--rate", type=float, help="Sending speed (x real time, 0 for as fast as possible)", default=1.0)
+	parser.add_argument("--loss", type=float, help="Chance of each byte being lost", default=0.0)
+	parser.add_argument("--legacy", help="Send legacy frames", action="store_true", default=False)
+	parser.add_argument("--tone_hz", type=float, help="Test tone frequency (Hz)", default=500.0)
+	parser.add_argument("--bench", type=int, help="Read this many chunks with Chunked_Arduino_ADC and report", default=None)
+	parser.add_argument("-t", "--ts_us", type=int, help="Sampling period (us) asked for when benchmarking", default=200)
+	parser.add_argument("-c", "--chunk_size", type=int, help="Samples per chunk", default=2500)
+	parser.add_argument("-b", "--baud", type=int, help="Baud rate asked for when benchmarking", default=115200)
+	args = parser.parse_args()
+
+	emu = Arduino_Emulator(args.savefile, args.ts_us, args.chunk_size, rate=args.rate, loss=args.loss,
+		legacy=args.legacy, tone_hz=args.tone_hz)
+	emu.start()
+
+	try:
+		if args.bench == None:
+			print("Emulating arduino on %s" % emu.port)
+			while emu.is_running():
+				time.sleep(1)
+				print(emu.get_status())
+		else:
+			from Chunked_Arduino_ADC import Chunked_Arduino_ADC
+
+			record_q = queue.Queue()
+			adc = Chunked_Arduino_ADC(emu.ts_us, emu.chunk_size, record_q, ser_port=emu.port, baud=args.baud)
+			adc.start()
+			latency = []
+			record_q.get(timeout=10)
+			start_time = time.perf_counter()
+			for ii in range(args.bench):
+				record_q.get(timeout=10)
+				send_times = dict(emu.send_times)
+				if adc.decoder.frame_num in send_times:
+					latency.append(time.perf_counter() - send_times[adc.decoder.frame_num])
+			elapsed = time.perf_counter() - start_time
+			adc.stop()
+			print("%d chunks in %.3f s, %.1f chunks/s, %.1f kS/s" % (args.bench, elapsed, args.bench / elapsed,
+				args.bench * emu.chunk_size / elapsed / 1e3))
+			if latency:
+				print("Latency mean %.3f ms, max %.3f ms" % (np.mean(latency) * 1e3, np.max(latency) * 1e3))
+			print(adc.get_status())
+			print(emu.get_status())
+	except KeyboardInterrupt as e:
+		pass
+
+	emu.stop()
@@ -0,0 +1,120 @@
+#Imports
+import os
+import glob
+import json
+import time
+import multiprocessing
+from Processor import Processor
+from Raw_Recording import load_recording
+
+#Processors already built in this worker process, keyed by (ts_us, chunk_size)
+procs = {}
+
+################################################################################
+def analyze_file(savefile):
+	"""
+	PURPOSE: processes every cpi in one recording
+	ARGS:
+		savefile (str): .mat or .raw recording in the Chunk_Saver format, or 
+			a segment manifest (.json)
+	RETURNS: tuple of (savefile, result dictionary or None, error string or
+		None)
+	NOTES: runs in a worker process, never raises so one bad file can not
+		stop the run
+	"""
+	try:
+		ts_us, chunk_size, data = load_recording(savefile)
+		ts_us = float(ts_us)
+		chunk_size = int(chunk_size)
+		key = (ts_us, chunk_size)
+		if key not in procs:
+			procs[key] = Processor(ts_us, chunk_size, None, None, real_fft=True)
+		return (savefile, procs[key].process_batch(data), None)
+	except Exception as e:
+		return (savefile, None, "%s: %s" % (type(e).__name__, e))
+
+################################################################################
+def find_files(paths):
+	"""
+	PURPOSE: expands directories and globs into a list of recordings
+	ARGS:
+		paths (list): directories, globs or files
+	RETURNS: sorted list of .mat and .raw files and segment manifests
+		(.json)
+	NOTES: segments listed in a manifest found in a directory are left
+		out, so they are only processed once as part of the manifest.
+		Other .json files in a directory are skipped
+	"""
+	savefiles = set()
+	for path in paths:
+		if os.path.isdir(path):
+			savefiles.update(glob.glob(os.path.join(path, "*.mat")))
+			savefiles.update(glob.glob(os.path.join(path, "*.raw")))
+			for manifest_file in glob.glob(os.path.join(path, "*.json")):
+				try:
+					with open(manifest_file) as f:
+						segments = json.load(f)["segments"]
+				except (ValueError, KeyError, TypeError) as e:
+					continue
+				savefiles.add(manifest_file)
+				for seg in segments:
+					savefiles.discard(os.path.join(path, seg["file"]))
+		else:
+			savefiles.update(glob.glob(path))
+	return sorted(savefiles)
+
+################################################################################
+def analyze(savefiles, outfile, workers=None):
+	"""
+	PURPOSE: processes many recordings in parallel into one csv file
+	ARGS:
+		savefiles (list): recordings (.mat, .raw or .json manifests) to process
+		outfile (str): csv file to write per cpi results to
+		workers (int): number of worker processes, defaults to the number of
+			cores
+	RETURNS: list of (savefile, error) for every file that failed
+	NOTES: results are written as each file finishes, so the rows of
+		different files are not in input order
+	"""
+	failed = []
+	start_time = time.time()
+	pool = multiprocessing.Pool(workers)
+	try:
+		with open(outfile, "w") as f:
+			f.write("file,cpi_num,eng,detc,vel\n")
+			for ii, (savefile, res, err) in enumerate(pool.imap_unordered(analyze_file, savefiles)):
+				if err != None:
+					failed.append((savefile, err))
+					print("[%d/%d] FAILED %s (%s)" % (ii + 1, len(savefiles), savefile, err))
+					continue
+				for jj in range(res["cpi_num"].shape[0]):
+					f.write("%s,%d,%.6f,%d,%.4f\n" % (savefile, res["cpi_num"][jj], res["eng"][jj],
+						res["detc"][jj], res["vel"][jj]))
+				print("[%d/%d] %s: %d CPIs, %d detections (%.1f s elapsed)" % (ii + 1, len(savefiles), savefile,
+					res["cpi_num"].shape[0], res["detc"].sum(), time.time() - start_time))
+	finally:
+		pool.close()
+		pool.join()
+	return failed
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Batch Analyzer")
+	parser.add_argument("paths", type=str, nargs="+", help="Recordings, directories or globs to process")
+	parser.add_argument("-o", "--out", "--outfile", type=str, dest="outfile", help="CSV file to write results to", default="results.csv")
+	parser.add_argument("-w", "--workers", type=int, help="Worker processes (default all cores)", default=None)
+	args = parser.parse_args()
+
+	#A csv among the inputs is most likely meant to be the output
+	for path in args.paths:
+		if path.endswith(".csv"):
+			parser.error("'%s' is not a recording, give the output file with -o/--out" % path)
+
+	savefiles = find_files(args.paths)
+	if not savefiles:
+		print("ERROR: no recordings found")
+	else:
+		failed = analyze(savefiles, args.outfile, args.workers)
+		print("Processed %d of %d recordings into %s" % (len(savefiles) - len(failed), len(savefiles), args.outfile))
@@ -0,0 +1,276 @@
+#Imports
+import queue
+import time
+import os
+import json
+import tempfile
+import subprocess
+import numpy as np
+from Replayer_2 import Replayer
+from Processor import Processor
+from Chunk_Saver import Chunk_Saver
+from Bounded_Queue import Bounded_Queue, NEVER_DROP
+from Stage_Timer import Stage_Timer
+try:
+	import resource
+except ImportError:
+	resource = None
+
+################################################################################
+class Benchmark:
+	"""
+	Pushes recordings through the replayer, processor and saver as fast as
+	possible (no GUI) and measures the throughput of the pipeline
+	"""
+	def __init__(self, savefile, chunk_size=None, nfft_pad=2, loops=5, real_fft=True, fft_backend="numpy"):
+		"""
+		PURPOSE: creates a new Benchmark
+		ARGS:
+			savefile (str): the .mat recording to replay
+			chunk_size (int): number of samples in one cpi, if None uses the
+				value in the recording
+			nfft_pad (int): fft size is 2 ** (nextpow2(chunk_size) + nfft_pad)
+			loops (int): number of times to replay the recording
+			real_fft (bool): if True the processor uses the real fft
+			fft_backend (str): fft library the processor uses
+		RETURNS: new instance of a Benchmark
+		NOTES:
+		"""
+		#Save arguments
+		self.savefile = savefile
+		self.chunk_size = chunk_size
+		self.nfft_pad = int(nfft_pad)
+		self.loops = int(loops)
+		self.real_fft = real_fft
+		self.fft_backend = fft_backend
+
+	############################################################################
+	def run(self):
+		"""
+		PURPOSE: runs the benchmark once
+		ARGS: none
+		RETURNS: dictionary of measurements
+		NOTES: every stage keeps each duration so its percentiles are exact
+		"""
+		record_q = Timed_Queue(policy=NEVER_DROP)
+		save_q = Bounded_Queue(policy=NEVER_DROP)
+		res_q = Bounded_Queue(policy=NEVER_DROP)
+
+		#Setup modules, the replayer sends every chunk without throttling
+		replay_timer = Stage_Timer(keep_samples=True)
+		replayer = Replayer(self.savefile, [record_q, save_q], chunk_size=self.chunk_size, rate=0,
+			loops=self.loops, timing=replay_timer)
+		chunk_size = int(replayer.chunk_size)
+		ts_us = float(replayer.ts_us)
+		proc_timer = Stage_Timer(keep_samples=True)
+		proc = Processor(ts_us, chunk_size, record_q, res_q, real_fft=self.real_fft,
+			fft_backend=self.fft_backend, nfft_pad=self.nfft_pad, res_slots=64, timing=proc_timer)
+		tmp_dir = tempfile.mkdtemp()
+		saver = Chunk_Saver(os.path.join(tmp_dir, "benchmark.mat"), ts_us, chunk_size, save_q)
+		num_cpis = replayer.num_chunks * self.loops
+		res_times = np.zeros(num_cpis)
+
+		#Start threads, they only report running once their loops start
+		proc.start()
+		saver.start()
+		deadline = time.perf_counter() + 5
+		while not (proc.is_running() and saver.is_running()) and time.perf_counter() < deadline:
+			time.sleep(0.001)
+
+		#Replay every chunk while collecting results
+		start_time = time.perf_counter()
+		replayer.start()
+		num_res = 0
+		while proc.cpi_num < num_cpis and proc.is_running():
+			num_res += self.collect(res_q, res_times, block=True)
+		num_res += self.collect(res_q, res_times, block=False)
+		proc_time = time.perf_counter() - start_time
+		replayer.stop()
+
+		#Wait for saver to catch up and write the file
+		while save_q.qsize() and saver.is_running():
+			time.sleep(0.001)
+		drain_time = time.perf_counter() - start_time
+		saver.stop()
+		save_time = time.perf_counter() - start_time - drain_time
+
+		#Stop threads
+		proc.stop()
+		for name in os.listdir(tmp_dir):
+			os.remove(os.path.join(tmp_dir, name))
+		os.rmdir(tmp_dir)
+
+		#Compute statistics
+		stage_us = {}
+		for name in proc_timer.stats:
+			stage_us[name] = proc_timer.get_percentiles(name)
+		replay_stage_us = {}
+		for name in replay_timer.stats:
+			replay_stage_us[name] = replay_timer.get_percentiles(name)
+		put_times = np.array(record_q.put_times[:num_cpis])
+		got_res = res_times > 0
+		lat_ms = (res_times[got_res] - put_times[got_res]) * 1e3
+		cpi_time = chunk_size * ts_us / 1e6
+		cpi_rate = proc.cpi_num / proc_time
+		res = {
+			"recording": os.path.basename(self.savefile),
+			"chunk_size": chunk_size,
+			"nfft": proc.nfft,
+			"fft_backend": self.fft_backend,
+			"real_fft": self.real_fft,
+			"num_cpis": proc.cpi_num,
+			"cpis_per_s": cpi_rate,
+			"realtime_factor": cpi_rate * cpi_time,
+			"proc_latency_ms": percentiles(lat_ms),
+			"proc_stage_us": stage_us,
+			"replay_stage_us": replay_stage_us,
+			"saver_drain_s": drain_time,
+			"saver_write_s": save_time,
+			"queue_high_water": {"record_q": record_q.high_water, "save_q": save_q.high_water, "res_q": res_q.high_water},
+			"peak_rss_mb": peak_rss_mb(),
+			"res_dropped": proc.get_status()["res_dropped"]
+		}
+		return res
+
+	############################################################################
+	def collect(self, res_q, res_times, block):
+		"""
+		PURPOSE: records the arrival time of results waiting in the queue
+		ARGS:
+			res_q (Queue): result queue
+			res_times (numpy array): arrival times indexed by cpi number
+			block (bool): if True waits for at least one result
+		RETURNS: (int) number of results collected
+		NOTES:
+		"""
+		num = 0
+		while True:
+			try:
+				res = res_q.get(block=(block and num == 0), timeout=0.1)
+			except queue.Empty as e:
+				return num
+			res_times[res.cpi_num] = time.perf_counter()
+			res.release()
+			num += 1
+
+################################################################################
+class Timed_Queue(Bounded_Queue):
+	"""
+	Bounded_Queue that remembers when each item was put, to measure latency
+	"""
+	def __init__(self, maxsize=0, policy=NEVER_DROP):
+		"""
+		PURPOSE: creates a new Timed_Queue
+		ARGS:
+			maxsize (int): most items held, 0 for no limit
+			policy (str): what 'put' does when full, see Bounded_Queue
+		RETURNS: new instance of a Timed_Queue
+		NOTES: put_times grows with every item, so this is for benchmarks
+		"""
+		super().__init__(maxsize, policy)
+		self.put_times = []
+
+	############################################################################
+	def _put(self, item):
+		"""
+		PURPOSE: adds an item and records the time
+		ARGS:
+			item (object): item to add
+		RETURNS: none
+		NOTES: called by queue.Queue with the lock held
+		"""
+		self.put_times.append(time.perf_counter())
+		super()._put(item)
+
+################################################################################
+def percentiles(x):
+	"""
+	PURPOSE: summarizes a set of latencies
+	ARGS:
+		x (numpy array): latencies
+	RETURNS: dictionary of percentiles
+	NOTES: empty if there are no latencies
+	"""
+	if not len(x):
+		return {}
+	return {
+		"p50": float(np.percentile(x, 50)),
+		"p90": float(np.percentile(x, 90)),
+		"p99": float(np.percentile(x, 99)),
+		"max": float(np.max(x))
+	}
+
+################################################################################
+def format_ms(lat, key):
+	"""
+	PURPOSE: formats one latency percentile for the results table
+	ARGS:
+		lat (dict): percentiles from 'percentiles'
+		key (str): percentile to format, like 'p50'
+	RETURNS: (str) milliseconds, or 'n/a' if there were no latencies
+	NOTES:
+	"""
+	if key not in lat:
+		return "n/a"
+	return "%.2f" % lat[key]
+
+################################################################################
+def peak_rss_mb():
+	"""
+	PURPOSE: gets the peak resident memory of this process
+	ARGS: none
+	RETURNS: (float) peak resident memory in MB, or None if unknown
+	NOTES: only available on unix
+	"""
+	if resource == None:
+		return None
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+################################################################################
+def git_commit():
+	"""
+	PURPOSE: gets the commit the benchmark is running on
+	ARGS: none
+	RETURNS: (str) commit hash, or None if unknown
+	NOTES:
+	"""
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"],
+			cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError) as e:
+		return None
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+
+	data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data")
+
+	parser = argparse.ArgumentParser(description="Pipeline Benchmark")
+	parser.add_argument("savefiles", type=str, nargs="*", help=".mat files to replay",
+		default=[os.path.join(data_dir, "car.mat"), os.path.join(data_dir, "cars3.mat")])
+	parser.add_argument("-c", "--chunk_sizes", type=int, nargs="+", help="Chunk sizes to sweep", default=[2500])
+	parser.add_argument("-p", "--nfft_pads", type=int, nargs="+", help="FFT padding exponents to sweep", default=[2])
+	parser.add_argument("-l", "--loops", type=int, help="Times to replay each file", default=5)
+	parser.add_argument("-f", "--fft", type=str, help="FFT backend", default="numpy")
+	parser.add_argument("--complex_fft", help="Use the complex fft", action="store_true", default=False)
+	parser.add_argument("-o", "--output", type=str, help="JSON file to write results to", default=None)
+	args = parser.parse_args()
+
+	runs = []
+	print("%-10s %-6s %-6s %9s %8s %9s %9s %9s" % ("file", "chunk", "nfft", "CPIs/s", "xRT", "p50 ms", "p99 ms", "RSS MB"))
+	for savefile in args.savefiles:
+		for chunk_size in args.chunk_sizes:
+			for nfft_pad in args.nfft_pads:
+				bench = Benchmark(savefile, chunk_size, nfft_pad, args.loops,
+					real_fft=not args.complex_fft, fft_backend=args.fft)
+				res = bench.run()
+				runs.append(res)
+				print("%-10s %-6d %-6d %9.1f %8.1f %9s %9s %9.1f%s" % (res["recording"], res["chunk_size"],
+					res["nfft"], res["cpis_per_s"], res["realtime_factor"], format_ms(res["proc_latency_ms"], "p50"),
+					format_ms(res["proc_latency_ms"], "p99"), res["peak_rss_mb"] or 0,
+					"  BELOW REAL TIME" if res["realtime_factor"] < 1 else ""))
+
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump({"commit": git_commit(), "time": time.time(), "runs": runs}, f, indent=2)
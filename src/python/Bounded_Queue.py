@@ -0,0 +1,106 @@
+#Imports
+import queue
+
+#What to do when putting into a full queue
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+LATEST = "latest"
+NEVER_DROP = "never_drop"
+POLICIES = [BLOCK, DROP_OLDEST, LATEST, NEVER_DROP]
+
+################################################################################
+class Bounded_Queue(queue.Queue):
+	"""
+	A queue between two threads with a size limit, a policy for when it is
+	full and counters to see how it is keeping up
+	"""
+	def __init__(self, maxsize=0, policy=BLOCK, on_drop=None):
+		"""
+		PURPOSE: creates a new Bounded_Queue
+		ARGS:
+			maxsize (int): most items held, 0 for no limit
+			policy (str): what 'put' does when full
+				'block' - waits for room, like queue.Queue
+				'drop_oldest' - throws away the oldest items to make room
+				'latest' - only ever holds the newest item (maxsize is 1)
+				'never_drop' - grows past maxsize, for data that must be kept
+			on_drop (function): called with each item thrown away, to give
+				back pooled buffers
+		RETURNS: new instance of a Bounded_Queue
+		NOTES: otherwise works like queue.Queue
+		"""
+		if policy not in POLICIES:
+			raise ValueError("Unknown queue policy '%s', expected one of %s" % (policy, ", ".join(POLICIES)))
+		if policy == LATEST:
+			maxsize = 1
+		if policy == DROP_OLDEST and maxsize <= 0:
+			raise ValueError("A 'drop_oldest' queue needs a maxsize")
+		self.policy = policy
+		self.limit = int(maxsize)
+		self.on_drop = on_drop
+		super().__init__(0 if policy == NEVER_DROP else self.limit)
+
+		#Counters
+		self.enqueued = 0
+		self.dropped = 0
+		self.high_water = 0
+
+	############################################################################
+	def _put(self, item):
+		"""
+		PURPOSE: adds an item and updates the counters
+		ARGS:
+			item (object): item to add
+		RETURNS: none
+		NOTES: called by queue.Queue with the lock held
+		"""
+		self.queue.append(item)
+		self.enqueued += 1
+		self.high_water = max(self.high_water, len(self.queue))
+
+	############################################################################
+	def put(self, item, block=True, timeout=None):
+		"""
+		PURPOSE: adds an item following the queue's policy
+		ARGS:
+			item (object): item to add
+			block (bool): for 'block' queues, wait for room
+			timeout (float): for 'block' queues, seconds to wait for room
+		RETURNS: none
+		NOTES: only 'block' queues ever wait or raise queue.Full
+		"""
+		if self.policy in [BLOCK, NEVER_DROP]:
+			super().put(item, block, timeout)
+			return
+
+		dropped = []
+		with self.not_full:
+			while self._qsize() >= self.maxsize:
+				dropped.append(self.queue.popleft())
+			self.dropped += len(dropped)
+			self._put(item)
+			#Dropped items will never be marked done
+			self.unfinished_tasks += 1 - len(dropped)
+			self.not_empty.notify()
+		if self.on_drop:
+			for old in dropped:
+				self.on_drop(old)
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the queue counters
+		ARGS: none
+		RETURNS: dictionary of counters
+		NOTES:
+		"""
+		with self.mutex:
+			status = {
+				"policy" : self.policy,
+				"size" : self._qsize(),
+				"maxsize" : self.limit,
+				"enqueued" : self.enqueued,
+				"dropped" : self.dropped,
+				"high_water" : self.high_water
+			}
+		return status
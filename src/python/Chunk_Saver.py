@@ -1,8 +1,10 @@
 #Imports
 import threading
 import queue
-from scipy.io import savemat
 import numpy as np
+from Mat_Writer import Mat_Writer
+from Raw_Recording import Raw_Writer
+from Sample_Bus import Bus_Reader
 
 ################################################################################
 class Chunk_Saver:
@@ -13,12 +15,13 @@ class Chunk_Saver:
 		"""
 		PURPOSE: creates a new Chunk_Saver
 		ARGS:
-			savefile (str): full path to '.mat' file to save to
+			savefile (str): full path to '.mat' or '.raw' file to save to
 			ts_us (int): sampling period (microseconds)
 			chunk_size (int): number of samples to expect in one chunk
 			record_q (Queue): queue to push chunks to
 		RETURNS: new instance of a Chunk Saver
-		NOTES: does not save file until thread is stopped
+		NOTES: chunks are appended to the file as they arrive, so memory use 
+			stays constant and the file is readable at any time
 		"""
 		#Save arguments
 		self.savefile = str(savefile)
@@ -106,6 +109,7 @@ class Chunk_Saver:
 		"""
 		#Indicate processor is running
 		self.keep_going.set()
+		writer = None
 
 		try:
 			#Run until told to stop
@@ -114,11 +118,8 @@ class Chunk_Saver:
 					chunk = self.record_q.get(timeout=0.5)
 				except queue.Empty as e:
 					continue
-				if not self.chunk_count:
-					self.data = chunk
-				else:
-					self.data = np.concatenate((self.data, chunk))
-				self.chunk_count += 1
+				writer = self.save_chunk(writer, chunk)
+				self.record_q.task_done()
 		except Exception as e:
 			print("ERROR: 'saver thread' got exception %s" % type(e))
 			print(e)
@@ -126,17 +127,51 @@ class Chunk_Saver:
 
 		#Drain queue
 		while self.record_q.qsize():
-			chunk = self.record_q.get()
-			if not self.chunk_count:
-				self.data = chunk
-			else:
-				self.data = np.concatenate((self.data, chunk))
-			self.chunk_count += 1
-
-		#Save file
-		if self.chunk_count:
-			self.dict_to_save['data'] = self.data
-			savemat(self.savefile, mdict=self.dict_to_save)
+			writer = self.save_chunk(writer, self.record_q.get())
+			self.record_q.task_done()
+		#Stop holding up the bus writer now nothing reads
+		if isinstance(self.record_q, Bus_Reader):
+			self.record_q.close()
+
+		#Close file
+		if writer:
+			writer.close()
+
+	############################################################################
+	def open_writer(self, savefile, dtype):
+		"""
+		PURPOSE: creates a new save file
+		ARGS:
+			savefile (str): full path to file, saved in the raw format if it 
+				ends in '.raw' or as a .mat file otherwise
+			dtype (numpy dtype): type of the samples, raw adc counts (uint16) 
+				are saved as is, anything else as doubles
+		RETURNS: writer to append chunks to
+		NOTES:
+		"""
+		if np.dtype(dtype) != np.uint16:
+			dtype = "<f8"
+		if savefile.endswith(".raw"):
+			return Raw_Writer(savefile, self.ts_us, self.chunk_size, dtype)
+		return Mat_Writer(savefile, self.dict_to_save, dtype=dtype)
+
+	############################################################################
+	def save_chunk(self, writer, chunk):
+		"""
+		PURPOSE: appends a chunk to the save file
+		ARGS:
+			writer (Mat_Writer or Raw_Writer): open save file, or None if 
+				nothing has been saved yet
+			chunk (numpy array): chunk to save
+		RETURNS: the open writer
+		NOTES: the file is created when the first chunk arrives, with the 
+			sample type of that chunk
+		"""
+		if writer == None:
+			writer = self.open_writer(self.savefile, chunk.dtype)
+		writer.append(chunk)
+		self.chunk_count += 1
+		return writer
 
 ################################################################################
 if __name__ == "__main__":
@@ -1,24 +1,34 @@
 #Imports
 import threading
 import queue
-from scipy.io import savemat
+import time
 import numpy as np
+from Mat_Writer import Mat_Writer
+from Raw_Recording import Raw_Writer
+from Sample_Bus import Bus_Reader
+from Segment_Manifest import Segment_Manifest
 
 ################################################################################
 class Chunk_Saver:
 	"""
 	Saves chunks of data to a mat file
 	"""
-	def __init__(self, savefile, ts_us, chunk_size, record_q):
+	def __init__(self, savefile, ts_us, chunk_size, record_q, file_ext=".mat", seg_chunks=None, seg_secs=None, seg_bytes=None):
 		"""
 		PURPOSE: creates a new Chunk_Saver
 		ARGS:
-			savefile (str): full path to '.mat' file to save to
+			savefile (str): full path to file to save to, without extension
 			ts_us (int): sampling period (microseconds)
 			chunk_size (int): number of samples to expect in one chunk
 			record_q (Queue): queue to push chunks to
+			file_ext (str): '.mat' or '.raw', format of the save files
+			seg_chunks (int): starts a new file after this many chunks
+			seg_secs (float): starts a new file after this many seconds of data
+			seg_bytes (int): starts a new file before it grows past this size
 		RETURNS: new instance of a Chunk Saver
-		NOTES: does not save file until thread is stopped
+		NOTES: chunks are appended to the file as they arrive, so memory use 
+			stays constant and the file is readable at any time, every file 
+			is listed in order in '<savefile>_manifest.json'
 		"""
 		#Save arguments
 		self.savefile = str(savefile)
@@ -26,6 +36,10 @@ class Chunk_Saver:
 		self.chunk_size = int(chunk_size)
 		self.record_q = record_q
 		self.file_num = 0
+		self.file_ext = file_ext
+		self.seg_chunks = seg_chunks
+		self.seg_secs = seg_secs
+		self.seg_bytes = seg_bytes
 
 		#Setup thread variables
 		self.thread = None
@@ -38,6 +52,14 @@ class Chunk_Saver:
 		#Part of dictionary to be saved to mat file
 		self.dict_to_save = {'ts_us': self.ts_us, 'chunk_size': self.chunk_size}
 
+		#List of segment files
+		self.manifest = Segment_Manifest(self.savefile + "_manifest.json", self.ts_us, self.chunk_size)
+		self.seg_chunk_count = 0
+
+		#Finished segments are closed by a separate thread
+		self.close_q = queue.Queue()
+		self.close_thread = None
+
 	############################################################################
 	def __del__(self):
 		"""
@@ -107,6 +129,9 @@ class Chunk_Saver:
 		"""
 		#Indicate processor is running
 		self.keep_going.set()
+		writer = None
+		self.close_thread = threading.Thread(target = self.close_run)
+		self.close_thread.start()
 
 		try:
 			#Run until told to stop
@@ -115,11 +140,8 @@ class Chunk_Saver:
 					chunk = self.record_q.get(timeout=0.5)
 				except queue.Empty as e:
 					continue
-				if not self.chunk_count:
-					self.data = chunk
-				else:
-					self.data = np.concatenate((self.data, chunk))
-				self.chunk_count += 1
+				writer = self.save_chunk(writer, chunk)
+				self.record_q.task_done()
 		except Exception as e:
 			print("ERROR: 'saver thread' got exception %s" % type(e))
 			print(e)
@@ -127,18 +149,101 @@ class Chunk_Saver:
 
 		#Drain queue
 		while self.record_q.qsize():
-			chunk = self.record_q.get()
-			if not self.chunk_count:
-				self.data = chunk
-			else:
-				self.data = np.concatenate((self.data, chunk))
-			self.chunk_count += 1
-
-		#Save file
-		if self.chunk_count:
-			self.dict_to_save['data'] = self.data
+			writer = self.save_chunk(writer, self.record_q.get())
+			self.record_q.task_done()
+		#Stop holding up the bus writer now nothing reads
+		if isinstance(self.record_q, Bus_Reader):
+			self.record_q.close()
+
+		#Close file
+		if writer:
+			self.close_q.put(writer)
+		self.close_q.put(None)
+		self.close_thread.join()
+		self.close_thread = None
+
+	############################################################################
+	def close_run(self):
+		"""
+		PURPOSE: closes finished segments
+		ARGS: none
+		RETURNS: none
+		NOTES: runs in a separate thread so the saver never waits on it, 
+			stops when it gets None
+		"""
+		while True:
+			writer = self.close_q.get()
+			if writer == None:
+				break
+			try:
+				writer.close()
+				self.manifest.finish_segment(writer.savefile, writer.num_samps)
+			except Exception as e:
+				print("ERROR: 'saver close thread' got exception %s" % type(e))
+				print(e)
+
+	############################################################################
+	def open_writer(self, savefile, dtype):
+		"""
+		PURPOSE: creates a new save file
+		ARGS:
+			savefile (str): full path to file, saved in the raw format if it 
+				ends in '.raw' or as a .mat file otherwise
+			dtype (numpy dtype): type of the samples, raw adc counts (uint16) 
+				are saved as is, anything else as doubles
+		RETURNS: writer to append chunks to
+		NOTES:
+		"""
+		if np.dtype(dtype) != np.uint16:
+			dtype = "<f8"
+		if savefile.endswith(".raw"):
+			return Raw_Writer(savefile, self.ts_us, self.chunk_size, dtype)
+		return Mat_Writer(savefile, self.dict_to_save, dtype=dtype)
+
+	############################################################################
+	def save_chunk(self, writer, chunk):
+		"""
+		PURPOSE: appends a chunk to the save file
+		ARGS:
+			writer (Mat_Writer or Raw_Writer): open save file, or None if 
+				nothing has been saved yet
+			chunk (numpy array): chunk to save
+		RETURNS: the open writer
+		NOTES: the file is created when the first chunk arrives, with the 
+			sample type of that chunk, and a new one is started whenever the 
+			segment is full (segments always end on a chunk)
+		"""
+		if writer != None and self.segment_full(writer, chunk):
+			self.close_q.put(writer)
+			writer = None
+		if writer == None:
 			self.file_num += 1
-			savemat("%s_%d.mat" % (self.savefile, self.file_num), mdict=self.dict_to_save)
+			savefile = "%s_%d%s" % (self.savefile, self.file_num, self.file_ext)
+			writer = self.open_writer(savefile, chunk.dtype)
+			self.manifest.add_segment(savefile, time.time())
+			self.seg_chunk_count = 0
+		writer.append(chunk)
+		self.chunk_count += 1
+		self.seg_chunk_count += 1
+		return writer
+
+	############################################################################
+	def segment_full(self, writer, chunk):
+		"""
+		PURPOSE: checks if the next chunk belongs in a new segment
+		ARGS:
+			writer (Mat_Writer or Raw_Writer): current segment
+			chunk (numpy array): next chunk to save
+		RETURNS: (bool) True to start a new segment
+		NOTES:
+		"""
+		if self.seg_chunks and self.seg_chunk_count >= self.seg_chunks:
+			return True
+		if self.seg_secs and writer.num_samps * self.ts_us / 1e6 >= self.seg_secs:
+			return True
+		if self.seg_bytes and writer.file_len(writer.num_samps + len(chunk)) > self.seg_bytes:
+			return True
+		return False
 
 ################################################################################
 if __name__ == "__main__":
@@ -3,32 +3,42 @@ import serial
 import serial.tools.list_ports as list_ports
 import threading
 import queue
-import numpy as np
-import struct
+from Frame_Decoder import Frame_Decoder, DEFAULT_BAUD
+from Sample_Bus import Sample_Bus
 
 ################################################################################
 class Chunked_Arduino_ADC:
 	"""
 	Reads values from the arduino and writes them to a queue
 	"""
-	def __init__(self, ts_us, chunk_size, record_qs, ser_port=None):
+	def __init__(self, ts_us, chunk_size, record_qs, ser_port=None, raw_counts=False, baud=DEFAULT_BAUD):
 		"""
 		PURPOSE: creates a new Chunked_Arduino_ADC
 		ARGS:
 			ts_us (int): sampling period of arduino (microseconds)
 			chunk_size (int): number of samples to expect in one chunk
-			record_qs (list): queues to push chunks to
+			record_qs (list or Sample_Bus): queues to push chunks to, or a bus
+				to decode chunks into once for every consumer
 			ser_port (str): serial port to listen on, will try to find arduino 
 				if left as None
+			raw_counts (bool): if True chunks are the raw 10 bit adc counts 
+				(uint16) instead of volts (float64)
+			baud (int): baud rate to ask the arduino for
 		RETURNS: new instance of an Chunked_Arduino_ADC
-		NOTES:
+		NOTES: the sample period, chunk size and baud rate are sent to the
+			arduino when we connect, arduino code that does not answer is
+			assumed to send legacy frames at 200 us and 115200 baud
 		"""
 		#Save arguments
 		self.ts_us = int(ts_us)
 		self.chunk_size = int(chunk_size)
 		self.record_qs = record_qs
+		self.bus = record_qs if isinstance(record_qs, Sample_Bus) else None
 		self.ser_timeout = self.chunk_size * self.ts_us / 1e6 * 2.5
 		self.ser_port = ser_port
+		self.raw_counts = raw_counts
+		self.baud = int(baud)
+		self.decoder = Frame_Decoder(self.chunk_size, self.raw_counts)
 
 		#Setup record thread variables
 		self.record_thread = None
@@ -38,6 +48,7 @@ class Chunked_Arduino_ADC:
 		#Status variables
 		self.connected = False
 		self.receiving_data = False
+		self.error = None
 
 	############################################################################
 	def __del__(self):
@@ -90,13 +101,16 @@ class Chunked_Arduino_ADC:
 		PURPOSE: gets the status of this thread
 		ARGS: none
 		RETURNS: dictionary of statuses
-		NOTES:
+		NOTES: includes the link quality counters from the frame decoder. 
+			'error' says why recording stopped, or is None
 		"""
 		status = {
 			"running" : self.is_running(),
 			"connected" : self.connected,
-			"receiving_data" : self.receiving_data
+			"receiving_data" : self.receiving_data,
+			"error" : self.error
 		}
+		status.update(self.decoder.get_status())
 		return status
 
 	############################################################################
@@ -109,6 +123,7 @@ class Chunked_Arduino_ADC:
 		"""
 		#Indicate thread is running
 		self.record_keep_going.set()
+		self.error = None
 
 		sh = None
 		try:
@@ -126,13 +141,24 @@ class Chunked_Arduino_ADC:
 								if port[1].find("Arduino Mega 2560") >= 0:
 									ser_port = port[0]
 									break
-						sh = serial.Serial(ser_port, 115200, timeout=self.ser_timeout)
+						sh = serial.Serial(ser_port, DEFAULT_BAUD, timeout=self.ser_timeout)
 						if sh and not sh.isOpen():
 							sh.close()
 							sh = None
 							self.connected = False
 							self.receiving_data = False
 						else:
+							try:
+								self.decoder.negotiate(sh, self.ts_us, self.baud)
+							except ValueError as e:
+								#The arduino would nak the same config again, so
+								#stop rather than retry
+								self.error = "arduino rejected config (sample period/baud): %s" % e
+								print("ERROR: " + self.error)
+								sh.close()
+								sh = None
+								self.record_keep_going.clear()
+								break
 							self.connected = True
 					except serial.serialutil.SerialException as e:
 						if sh:
@@ -140,26 +166,22 @@ class Chunked_Arduino_ADC:
 						sh = None
 						self.connected = False
 						self.receiving_data = False
-				#We are now connected to the arduino so reset cur idx
-				cur_idx = 0
+				#We are now connected to the arduino so forget old bytes
+				self.decoder.reset()
 				#Record from arduino
 				while self.is_running() and self.connected:
 					try:
-						sync_count = 0
-						while sync_count < 2:
-							data = sh.read(1)
-							if len(data):
-								if data[0] == 255:
-									sync_count += 1
-								else:
-									sync_count = 0
-						data = sh.read(self.chunk_size * 2)
-						sample_chunk = np.array(struct.unpack('<%dH' % self.chunk_size, data))
-						to_put = sample_chunk / 1023 * 5
-						for record_q in self.record_qs:
-							record_q.put(to_put)
+						self.decoder.read_frame(sh)
+						if self.bus:
+							#Decode straight into the bus, no copies
+							self.decoder.decode(out=self.bus.claim())
+							self.bus.commit()
+						else:
+							to_put = self.decoder.decode()
+							for record_q in self.record_qs:
+								record_q.put(to_put)
 						self.receiving_data = True
-					except (serial.serialutil.SerialException, struct.error) as e:
+					except (serial.serialutil.SerialException, ValueError) as e:
 						self.receiving_data = False
 						if not sh.isOpen():
 							sh.close()
@@ -168,6 +190,7 @@ class Chunked_Arduino_ADC:
 		except Exception as e:
 			print("ERROR: 'recorder thread' got exception %s" % type(e))
 			print(e)
+			self.error = "recorder got exception %s: %s" % (type(e).__name__, e)
 			self.record_keep_going.clear()
 
 		#Cleanup
@@ -0,0 +1,140 @@
+#Imports
+import numpy as np
+
+#Names of the fft libraries, only numpy is always available
+BACKENDS = ["numpy", "scipy", "fftw"]
+
+################################################################################
+class FFT_Backend:
+	"""
+	Computes ffts with a selectable library, caching a plan per transform
+	"""
+	def __init__(self, name="numpy", workers=1):
+		"""
+		PURPOSE: creates a new FFT_Backend
+		ARGS:
+			name (str): fft library to use, options: numpy, scipy, fftw
+			workers (int): number of threads to use (scipy and fftw only)
+		RETURNS: new instance of an FFT_Backend
+		NOTES: raises ValueError if the library is unknown or not installed,
+			the library is only imported here so unused ones cost nothing
+		"""
+		self.lib = load_library(name)
+		if self.lib == None:
+			raise ValueError("FFT backend '%s' is not available" % name)
+		self.name = name
+		self.workers = int(workers)
+		self.plans = {}
+
+	############################################################################
+	def fft(self, sig, nfft, real=False):
+		"""
+		PURPOSE: computes the fft along the last axis
+		ARGS:
+			sig (numpy array): signal, or matrix with one signal per row
+			nfft (int): size of the fft, signal is zero padded up to it
+			real (bool): if True only computes the non-negative half
+		RETURNS: numpy array representing signal in frequency domain
+		NOTES: the fftw backend returns its own output buffer which is
+			overwritten by the next call with the same plan
+		"""
+		sig = np.asarray(sig)
+		key = (nfft, sig.dtype, real, sig.shape)
+		plan = self.plans.get(key)
+		if plan == None:
+			plan = self.make_plan(nfft, sig.dtype, real, sig.shape)
+			self.plans[key] = plan
+		return plan(sig)
+
+	############################################################################
+	def make_plan(self, nfft, dtype, real, shape):
+		"""
+		PURPOSE: creates a function that performs one kind of transform
+		ARGS:
+			nfft (int): size of the fft
+			dtype (numpy dtype): type of the input signal
+			real (bool): if True only computes the non-negative half
+			shape (tuple): shape of the input signal
+		RETURNS: function taking the signal and returning its fft
+		NOTES:
+		"""
+		if self.name == "numpy":
+			if real:
+				return lambda sig: np.fft.rfft(sig, n=nfft, axis=-1)
+			return lambda sig: np.fft.fft(sig, n=nfft, axis=-1)
+		if self.name == "scipy":
+			scipy_fft = self.lib
+			if real:
+				return lambda sig: scipy_fft.rfft(sig, n=nfft, axis=-1, workers=self.workers)
+			return lambda sig: scipy_fft.fft(sig, n=nfft, axis=-1, workers=self.workers)
+
+		#fftw needs a fixed, zero padded input buffer to plan against
+		pyfftw = self.lib
+		sig_len = shape[-1]
+		in_dtype = np.float64 if real else np.complex128
+		in_buf = pyfftw.zeros_aligned(shape[:-1] + (nfft,), dtype=in_dtype)
+		if real:
+			fftw = pyfftw.builders.rfft(in_buf, n=nfft, axis=-1, threads=self.workers,
+				planner_effort="FFTW_MEASURE", avoid_copy=True)
+		else:
+			fftw = pyfftw.builders.fft(in_buf, n=nfft, axis=-1, threads=self.workers,
+				planner_effort="FFTW_MEASURE", avoid_copy=True)
+		def plan(sig):
+			in_buf[..., :sig_len] = sig
+			return fftw()
+		return plan
+
+################################################################################
+def load_library(name):
+	"""
+	PURPOSE: imports the library behind a backend
+	ARGS:
+		name (str): backend name
+	RETURNS: the library's module, or None if it is unknown or not installed
+	NOTES:
+	"""
+	try:
+		if name == "numpy":
+			return np.fft
+		if name == "scipy":
+			import scipy.fft
+			return scipy.fft
+		if name == "fftw":
+			import pyfftw
+			import pyfftw.builders
+			return pyfftw
+	except ImportError as e:
+		pass
+	return None
+
+################################################################################
+def available_backends():
+	"""
+	PURPOSE: lists the fft libraries that can be used
+	ARGS: none
+	RETURNS: list of backend names
+	NOTES: imports every library to check it
+	"""
+	return [name for name in BACKENDS if load_library(name) != None]
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+	import timeit
+	from My_Utils import nextpow2
+
+	parser = argparse.ArgumentParser(description="FFT Backend Benchmark")
+	parser.add_argument("-w", "--workers", type=int, help="Threads per transform", default=1)
+	parser.add_argument("-n", "--number", type=int, help="CPIs to time per case", default=500)
+	args = parser.parse_args()
+
+	print("%-8s %-6s %-6s %-8s %10s" % ("backend", "chunk", "nfft", "fft", "us/CPI"))
+	for chunk_size in [1000, 2500, 5000, 10000]:
+		nfft = 2 ** (nextpow2(chunk_size) + 2)
+		sig = np.random.randn(chunk_size)
+		for name in available_backends():
+			backend = FFT_Backend(name, args.workers)
+			for real in [False, True]:
+				backend.fft(sig, nfft, real)
+				t = timeit.timeit(lambda: backend.fft(sig, nfft, real), number=args.number)
+				print("%-8s %-6d %-6d %-8s %10.1f" % (name, chunk_size, nfft, "real" if real else "complex", t / args.number * 1e6))
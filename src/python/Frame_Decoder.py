@@ -0,0 +1,415 @@
+#Imports
+import struct
+import time
+import numpy as np
+
+#Legacy frames are two 0xFF sync bytes then little endian uint16 samples,
+#samples are 10 bit so never contain the sync
+SYNC = b"\xff\xff"
+MAX_COUNT = 1023
+
+#Packed frames are a header (sync, frame number, number of samples), 4 samples
+#in every 5 bytes (4 low bytes then the high 2 bits of each) and the 16 bit sum
+#of the packed bytes
+PACKED_SYNC = b"\xa5\x5aDP"
+PACKED_HEADER = struct.Struct("<4sHH")
+PACKED_TRAILER = struct.Struct("<H")
+
+#Sent to the arduino at connect time (magic, ts_us, chunk_size, baud), it
+#replies with the same values after an ack or nak magic
+CONFIG = struct.Struct("<4sIHI")
+CONFIG_MAGIC = b"DCFG"
+ACK_MAGIC = b"DACK"
+NAK_MAGIC = b"DNAK"
+DEFAULT_BAUD = 115200
+
+################################################################################
+def pack_frame(frame_num, counts):
+	"""
+	PURPOSE: packs adc counts into a frame like the arduino sends
+	ARGS:
+		frame_num (int): frame number, wraps at 16 bits
+		counts (numpy array): 10 bit adc counts, length a multiple of 4
+	RETURNS: (bytes) the frame
+	NOTES: used by emulators and tests
+	"""
+	counts = np.asarray(counts, dtype=np.uint16).reshape(-1, 4)
+	groups = np.empty((counts.shape[0], 5), dtype=np.uint8)
+	groups[:, :4] = counts & 0xFF
+	groups[:, 4] = ((counts >> 8) << np.array([0, 2, 4, 6], dtype=np.uint16)).sum(axis=1)
+	payload = groups.tobytes()
+	return (PACKED_HEADER.pack(PACKED_SYNC, frame_num & 0xFFFF, counts.size) + payload +
+		PACKED_TRAILER.pack(int(groups.sum(dtype=np.uint32)) & 0xFFFF))
+
+################################################################################
+def legacy_frame(counts):
+	"""
+	PURPOSE: makes a frame like the original arduino code sends
+	ARGS:
+		counts (numpy array): 10 bit adc counts
+	RETURNS: (bytes) the frame
+	NOTES: used by emulators and tests
+	"""
+	return SYNC + np.asarray(counts, dtype="<u2").tobytes()
+
+################################################################################
+class Frame_Decoder:
+	"""
+	Reads frames of samples from the arduino into a preallocated buffer and
+	decodes them without going through python objects per sample
+	"""
+	def __init__(self, chunk_size, raw_counts=False, block_size=4096, packed=False):
+		"""
+		PURPOSE: creates a new Frame_Decoder
+		ARGS:
+			chunk_size (int): number of samples in one frame
+			raw_counts (bool): if True decodes to raw adc counts (uint16)
+				instead of volts (float64)
+			block_size (int): most extra bytes to read past the current frame
+				when they are already waiting
+			packed (bool): if True expects packed frames, if False legacy
+				frames, 'negotiate' sets this from what the arduino supports
+		RETURNS: new instance of a Frame_Decoder
+		NOTES: packed frames need chunk_size to be a multiple of 4
+		"""
+		self.chunk_size = int(chunk_size)
+		self.raw_counts = raw_counts
+		self.block_size = int(block_size)
+
+		#Receive buffer, big enough for either kind of frame. Bytes in
+		#[start, end) have been read but not used
+		self.buf = bytearray(2 * (len(SYNC) + self.chunk_size * 2) + self.block_size)
+		self.buf_view = memoryview(self.buf)
+		self.frame_pos = 0
+		self.set_packed(packed)
+
+		#Unpacking buffers, reused for every frame
+		self.counts = np.empty(self.chunk_size, dtype=np.uint16)
+		self.counts4 = self.counts[:self.chunk_size // 4 * 4].reshape(-1, 4)
+		self.high_bits = np.empty_like(self.counts4)
+		self.shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+		#Link quality counters
+		self.frames = 0
+		self.resyncs = 0
+		self.dropped_bytes = 0
+		self.misaligned_frames = 0
+		self.bad_checksums = 0
+		self.lost_frames = 0
+
+	############################################################################
+	def set_packed(self, packed):
+		"""
+		PURPOSE: sets which kind of frame to expect
+		ARGS:
+			packed (bool): True for packed frames, False for legacy frames
+		RETURNS: none
+		NOTES: also forgets any buffered bytes
+		"""
+		if packed and self.chunk_size % 4:
+			raise ValueError("Packed frames need a chunk size that is a multiple of 4")
+		self.packed = packed
+		if packed:
+			self.sync = PACKED_SYNC
+			self.packed_len = self.chunk_size * 5 // 4
+			self.frame_len = PACKED_HEADER.size + self.packed_len + PACKED_TRAILER.size
+		else:
+			self.sync = SYNC
+			self.frame_len = len(SYNC) + self.chunk_size * 2
+		self.reset()
+
+	############################################################################
+	def reset(self):
+		"""
+		PURPOSE: forgets any bytes left over from a previous connection
+		ARGS: none
+		RETURNS: none
+		NOTES: counters are kept
+		"""
+		self.start = 0
+		self.end = 0
+		self.frame_num = None
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the link quality counters
+		ARGS: none
+		RETURNS: dictionary of counters
+		NOTES:
+		"""
+		status = {
+			"packed" : self.packed,
+			"frames" : self.frames,
+			"resyncs" : self.resyncs,
+			"dropped_bytes" : self.dropped_bytes,
+			"misaligned_frames" : self.misaligned_frames,
+			"bad_checksums" : self.bad_checksums,
+			"lost_frames" : self.lost_frames
+		}
+		return status
+
+	############################################################################
+	def negotiate(self, sh, ts_us, baud=DEFAULT_BAUD, timeout=3.0):
+		"""
+		PURPOSE: asks the arduino for packed frames at a sample period and
+			baud rate
+		ARGS:
+			sh (Serial): serial port, open at DEFAULT_BAUD
+			ts_us (int): sampling period (microseconds)
+			baud (int): baud rate to switch to
+			timeout (float): seconds to wait for a reply
+		RETURNS: True if the arduino switched to packed frames, False if it
+			did not reply (legacy code, which always streams legacy frames)
+		NOTES: the config is resent until a reply comes since the arduino
+			resets when the port opens. Raises ValueError if the arduino can
+			not run with these settings
+		"""
+		config = CONFIG.pack(CONFIG_MAGIC, int(ts_us), self.chunk_size, int(baud))
+		reply = bytearray()
+		old_timeout = sh.timeout
+		sh.timeout = 0.25
+		try:
+			deadline = time.time() + timeout
+			while time.time() < deadline:
+				sh.write(config)
+				reply += sh.read(max(CONFIG.size, getattr(sh, "in_waiting", 0)))
+				if reply.find(NAK_MAGIC + config[4:]) >= 0:
+					raise ValueError("Arduino can not sample every %d us in chunks of %d at %d baud" %
+						(ts_us, self.chunk_size, baud))
+				if reply.find(ACK_MAGIC + config[4:]) >= 0:
+					sh.baudrate = int(baud)
+					self.set_packed(True)
+					return True
+				del reply[:-CONFIG.size]
+		finally:
+			sh.timeout = old_timeout
+		self.set_packed(False)
+		return False
+
+	############################################################################
+	def fill(self, sh, num_bytes):
+		"""
+		PURPOSE: makes sure at least num_bytes unused bytes are buffered
+		ARGS:
+			sh (Serial): open serial port
+			num_bytes (int): number of bytes needed
+		RETURNS: none
+		NOTES: reads what is needed plus anything already waiting, in one
+			call, raises ValueError if the port times out
+		"""
+		while self.end - self.start < num_bytes:
+			#Move leftover bytes to the front if there isn't room after them
+			if self.start and len(self.buf) - self.start < max(num_bytes, self.frame_len) + self.block_size:
+				self.buf[:self.end-self.start] = self.buf_view[self.start:self.end]
+				self.end -= self.start
+				self.start = 0
+			needed = num_bytes - (self.end - self.start)
+			waiting = getattr(sh, "in_waiting", 0)
+			to_read = min(max(needed, waiting), len(self.buf) - self.end)
+			num = sh.readinto(self.buf_view[self.end:self.end+to_read])
+			if not num:
+				raise ValueError("Timed out reading frame")
+			self.end += num
+
+	############################################################################
+	def drop(self, num_bytes):
+		"""
+		PURPOSE: throws away bytes that are not part of a good frame
+		ARGS:
+			num_bytes (int): number of bytes to throw away
+		RETURNS: none
+		NOTES:
+		"""
+		self.start += num_bytes
+		self.dropped_bytes += num_bytes
+
+	############################################################################
+	def read_frame(self, sh):
+		"""
+		PURPOSE: reads the next good frame from the serial port
+		ARGS:
+			sh (Serial): open serial port
+		RETURNS: none
+		NOTES: raises ValueError if the port timed out part way through. A
+			frame that fails its checks lost bytes, it is dropped and we
+			resync on the next sync word
+		"""
+		while True:
+			#Find the sync word, reading a whole frame since it is usually first
+			self.fill(sh, self.frame_len)
+			pos = self.buf.find(self.sync, self.start, self.end)
+			if pos < 0:
+				#Keep the last few bytes, they may be the start of a sync
+				self.resyncs += 1
+				self.drop(self.end - self.start - len(self.sync) + 1)
+				continue
+			if pos != self.start:
+				self.resyncs += 1
+				self.drop(pos - self.start)
+				continue
+
+			#Check the frame
+			if self.packed:
+				good = self.check_packed()
+			else:
+				good = self.check_legacy()
+			if not good:
+				self.resyncs += 1
+				continue
+
+			self.start += self.frame_len
+			self.frames += 1
+			return
+
+	############################################################################
+	def check_legacy(self):
+		"""
+		PURPOSE: checks the legacy frame at the start of the buffer
+		ARGS: none
+		RETURNS: True if the frame is good, False if bytes were dropped
+		NOTES: a frame with a sync word or an out of range sample in it is
+			the wrong length
+		"""
+		payload = self.start + len(SYNC)
+		inner = self.buf.find(SYNC, payload, self.start + self.frame_len)
+		if inner >= 0:
+			self.misaligned_frames += 1
+			self.drop(inner - self.start)
+			return False
+		high = np.frombuffer(self.buf, dtype=np.uint8, count=self.chunk_size * 2, offset=payload)[1::2]
+		if high.size and high.max() > MAX_COUNT >> 8:
+			#Off by one byte, try the next sync word
+			self.misaligned_frames += 1
+			self.drop(1)
+			return False
+		self.frame_pos = payload
+		return True
+
+	############################################################################
+	def check_packed(self):
+		"""
+		PURPOSE: checks the packed frame at the start of the buffer
+		ARGS: none
+		RETURNS: True if the frame is good, False if bytes were dropped
+		NOTES: counts frames missing between this one and the last
+		"""
+		frame_num, num_samps = PACKED_HEADER.unpack_from(self.buf, self.start)[1:]
+		if num_samps != self.chunk_size:
+			self.misaligned_frames += 1
+			self.drop(1)
+			return False
+		payload = self.start + PACKED_HEADER.size
+		check_sum = np.frombuffer(self.buf, dtype=np.uint8, count=self.packed_len, offset=payload).sum(dtype=np.uint32)
+		if int(check_sum) & 0xFFFF != PACKED_TRAILER.unpack_from(self.buf, payload + self.packed_len)[0]:
+			self.bad_checksums += 1
+			self.drop(1)
+			return False
+		if self.frame_num != None:
+			self.lost_frames += (frame_num - self.frame_num - 1) & 0xFFFF
+		self.frame_num = frame_num
+		self.frame_pos = payload
+		return True
+
+	############################################################################
+	def unpack(self):
+		"""
+		PURPOSE: unpacks the packed frame found by read_frame
+		ARGS: none
+		RETURNS: numpy array of adc counts
+		NOTES: the array is reused by the next call
+		"""
+		groups = np.frombuffer(self.buf, dtype=np.uint8, count=self.packed_len, offset=self.frame_pos).reshape(-1, 5)
+		np.copyto(self.counts4, groups[:, :4])
+		np.right_shift(groups[:, 4:], self.shifts, out=self.high_bits)
+		self.high_bits &= 3
+		self.high_bits <<= 8
+		self.counts4 |= self.high_bits
+		return self.counts
+
+	############################################################################
+	def decode(self, out=None):
+		"""
+		PURPOSE: decodes the frame found by read_frame
+		ARGS:
+			out (numpy array): array to decode into (uint16 for raw counts,
+				float64 for volts), if None a new one is made
+		RETURNS: numpy array of samples, owned by the caller
+		NOTES: the only allocation is the returned array, must be called
+			before the next read_frame
+		"""
+		if self.packed:
+			counts = self.unpack()
+		else:
+			counts = np.frombuffer(self.buf, dtype="<u2", count=self.chunk_size, offset=self.frame_pos)
+		if self.raw_counts:
+			if out is None:
+				return counts.copy()
+			np.copyto(out, counts)
+			return out
+		volts = np.divide(counts, 1023.0, out=out)
+		volts *= 5
+		return volts
+
+################################################################################
+if __name__ == "__main__":
+	import io
+	import timeit
+
+	chunk_size = 2500
+	number = 2000
+	samples = np.random.randint(0, 1024, chunk_size).astype("<u2")
+
+	#Old path: read a byte at a time to sync, unpack to a tuple of ints, make
+	#an array and scale
+	stream = io.BytesIO(legacy_frame(samples) * number)
+	def old_decode():
+		sh = stream
+		sync_count = 0
+		while sync_count < 2:
+			data = sh.read(1)
+			if data[0] == 255:
+				sync_count += 1
+			else:
+				sync_count = 0
+		data = sh.read(chunk_size * 2)
+		sample_chunk = np.array(struct.unpack('<%dH' % chunk_size, data))
+		return sample_chunk / 1023 * 5
+
+	decoder = Frame_Decoder(chunk_size)
+	def new_decode():
+		decoder.read_frame(stream)
+		return decoder.decode()
+
+	assert np.array_equal(old_decode(), new_decode())
+	for name, func in [("struct.unpack", old_decode), ("frombuffer", new_decode)]:
+		stream.seek(0)
+		decoder.reset()
+		t = timeit.timeit(func, number=number)
+		print("%-14s %8.1f us/frame" % (name, t / number * 1e6))
+
+	#Packed frames
+	stream = io.BytesIO(b"".join(pack_frame(ii, samples) for ii in range(number)))
+	decoder = Frame_Decoder(chunk_size, packed=True)
+	assert np.array_equal(new_decode(), samples / 1023 * 5)
+	stream.seek(0)
+	decoder.reset()
+	t = timeit.timeit(new_decode, number=number)
+	print("%-14s %8.1f us/frame" % ("packed", t / number * 1e6))
+
+	#Lose some bytes and add some garbage, every other frame should survive
+	for packed in [False, True]:
+		data = bytearray()
+		for ii in range(100):
+			frame = pack_frame(ii, samples) if packed else legacy_frame(samples)
+			data += frame[:-3] if ii % 2 else b"\x12" + frame
+		decoder = Frame_Decoder(chunk_size, packed=packed)
+		stream = io.BytesIO(bytes(data) + decoder.sync)
+		good = 0
+		try:
+			while True:
+				decoder.read_frame(stream)
+				good += np.array_equal(decoder.decode(), samples / 1023 * 5)
+		except ValueError as e:
+			pass
+		print("%d good frames, %s" % (good, decoder.get_status()))
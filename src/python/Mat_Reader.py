@@ -0,0 +1,230 @@
+#Imports
+import struct
+import collections
+import numpy as np
+
+#MAT v5 data types we can read directly, and the numpy type of each
+miMATRIX = 14
+MI_DTYPES = {
+	1: "<i1", 2: "<u1", 3: "<i2", 4: "<u2", 5: "<i4", 6: "<u4",
+	7: "<f4", 9: "<f8", 12: "<i8", 13: "<u8"
+}
+#MAT v5 array classes and the numpy type of each
+MX_DTYPES = {
+	6: "<f8", 7: "<f4", 8: "<i1", 9: "<u1", 10: "<i2", 11: "<u2",
+	12: "<i4", 13: "<u4", 14: "<i8", 15: "<u8"
+}
+
+################################################################################
+class Mat_Reader:
+	"""
+	Reads the 'data' vector of a .mat recording a chunk at a time instead of
+	loading it all into memory
+	"""
+	def __init__(self, savefile, chunk_size=None, cache_chunks=32, read_ahead=4):
+		"""
+		PURPOSE: creates a new Mat_Reader
+		ARGS:
+			savefile (str): .mat recording (ts_us, chunk_size, data)
+			chunk_size (int): number of samples read at a time, if None uses
+				the value in the file
+			cache_chunks (int): number of recently used chunks to keep
+			read_ahead (int): number of chunks read from disk at once
+		RETURNS: new instance of a Mat_Reader
+		NOTES: only uncompressed little endian files can be read lazily,
+			raises ValueError for anything else
+		"""
+		self.savefile = savefile
+		self.cache_chunks = max(int(cache_chunks), int(read_ahead))
+		self.read_ahead = int(read_ahead)
+		self.cache = collections.OrderedDict()
+
+		#Small variables are cheap to load, scipy skips over the data. 
+		#Imported here since scipy is slow to import
+		from scipy.io import loadmat
+		saved_data = loadmat(savefile, variable_names=['ts_us', 'chunk_size'])
+		self.ts_us = saved_data['ts_us'][0][0]
+		self.file_chunk_size = int(saved_data['chunk_size'][0][0])
+		self.chunk_size = self.file_chunk_size
+		if chunk_size != None:
+			self.chunk_size = int(chunk_size)
+
+		#Find where the samples are in the file
+		self.fh = open(savefile, "rb")
+		self.index_data()
+
+	############################################################################
+	def __del__(self):
+		"""
+		PURPOSE: performs any necessary cleanup
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.close()
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: closes the file
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		if getattr(self, "fh", None):
+			self.fh.close()
+			self.fh = None
+
+	############################################################################
+	def index_data(self):
+		"""
+		PURPOSE: finds the offset, type and length of the 'data' samples
+		ARGS: none
+		RETURNS: none
+		NOTES: walks the top level elements of the file, reading only their
+			headers
+		"""
+		self.fh.seek(0, 2)
+		file_len = self.fh.tell()
+		self.fh.seek(126)
+		if self.fh.read(2) != b"IM":
+			raise ValueError("%s is not a little endian MAT v5 file" % self.savefile)
+
+		pos = 128
+		while pos + 8 <= file_len:
+			self.fh.seek(pos)
+			mtype, nbytes = struct.unpack("<II", self.fh.read(8))
+			if mtype == miMATRIX:
+				#Array flags, dimensions, name, then the real part
+				flags = struct.unpack("<IIII", self.fh.read(16))
+				dims_tag = struct.unpack("<II", self.fh.read(8))
+				self.fh.seek(dims_tag[1] + (-dims_tag[1] % 8), 1)
+				name_tag = struct.unpack("<I", self.fh.read(4))[0]
+				if name_tag >> 16:
+					name = self.fh.read(4)[:name_tag >> 16]
+				else:
+					name_len = struct.unpack("<I", self.fh.read(4))[0]
+					name = self.fh.read(name_len + (-name_len % 8))[:name_len]
+				if name == b"data":
+					dtype, data_len = struct.unpack("<II", self.fh.read(8))
+					if dtype not in MI_DTYPES or (flags[2] & 0xFF) not in MX_DTYPES:
+						raise ValueError("Unsupported sample type in %s" % self.savefile)
+					self.data_pos = self.fh.tell()
+					self.file_dtype = np.dtype(MI_DTYPES[dtype])
+					self.dtype = np.dtype(MX_DTYPES[flags[2] & 0xFF])
+					#A file still being written can be shorter than declared
+					data_len = min(data_len, file_len - self.data_pos)
+					self.shape = (data_len // self.file_dtype.itemsize,)
+					self.num_chunks = self.shape[0] // self.chunk_size
+					return
+			pos += 8 + nbytes
+		raise ValueError("No uncompressed 'data' variable in %s" % self.savefile)
+
+	############################################################################
+	def __len__(self):
+		"""
+		PURPOSE: gets the number of samples
+		ARGS: none
+		RETURNS: (int) number of samples
+		NOTES:
+		"""
+		return self.shape[0]
+
+	############################################################################
+	def read_samps(self, num_samps):
+		"""
+		PURPOSE: reads samples from the current position in the file
+		ARGS:
+			num_samps (int): number of samples to read
+		RETURNS: numpy array of samples
+		NOTES:
+		"""
+		samps = np.empty(num_samps, dtype=self.file_dtype)
+		self.fh.readinto(samps)
+		return samps.astype(self.dtype, copy=False)
+
+	############################################################################
+	def get_chunk(self, idx):
+		"""
+		PURPOSE: gets one chunk of samples
+		ARGS:
+			idx (int): chunk number, the last chunk may be partial
+		RETURNS: read only numpy array of samples
+		NOTES: misses read 'read_ahead' chunks from disk at once
+		"""
+		chunk = self.cache.get(idx)
+		if chunk is not None:
+			self.cache.move_to_end(idx)
+			return chunk
+
+		#Read this chunk and the ones after it in one go
+		start = idx * self.chunk_size
+		stop = min((idx + self.read_ahead) * self.chunk_size, self.shape[0])
+		if start >= stop:
+			raise IndexError("Chunk %d is past the end of the data" % idx)
+		self.fh.seek(self.data_pos + start * self.file_dtype.itemsize)
+		block = self.read_samps(stop - start)
+		block.flags.writeable = False
+		for ii in range(0, stop - start, self.chunk_size):
+			self.cache[idx + ii // self.chunk_size] = block[ii:ii+self.chunk_size]
+			self.cache.move_to_end(idx + ii // self.chunk_size)
+		while len(self.cache) > self.cache_chunks:
+			self.cache.popitem(last=False)
+		return self.cache[idx]
+
+	############################################################################
+	def __getitem__(self, key):
+		"""
+		PURPOSE: gets a range of samples, like slicing an array
+		ARGS:
+			key (slice): samples to get, step must be 1
+		RETURNS: numpy array of samples
+		NOTES: a slice that is exactly one chunk is returned without copying
+		"""
+		if not isinstance(key, slice):
+			return self[key:key+1][0]
+		start, stop, step = key.indices(self.shape[0])
+		if step != 1:
+			raise IndexError("Only contiguous slices are supported")
+		if start >= stop:
+			return np.zeros(0, dtype=self.dtype)
+		first = start // self.chunk_size
+		last = (stop - 1) // self.chunk_size
+		if first == last:
+			offset = first * self.chunk_size
+			return self.get_chunk(first)[start-offset:stop-offset]
+		parts = [self.get_chunk(ii) for ii in range(first, last + 1)]
+		offset = first * self.chunk_size
+		return np.concatenate(parts)[start-offset:stop-offset]
+
+	############################################################################
+	def __array__(self, dtype=None, copy=None):
+		"""
+		PURPOSE: reads every sample into memory
+		ARGS:
+			dtype (numpy dtype): type to convert to
+			copy (bool): unused, always returns a new array
+		RETURNS: numpy array of samples
+		NOTES: bypasses the cache
+		"""
+		self.fh.seek(self.data_pos)
+		data = self.read_samps(self.shape[0])
+		if dtype != None:
+			data = data.astype(dtype, copy=False)
+		return data
+
+################################################################################
+if __name__ == "__main__":
+	import sys
+	import time
+	from scipy.io import loadmat
+
+	start_time = time.time()
+	reader = Mat_Reader(sys.argv[1])
+	print("Opened %d samples (%d chunks of %d) in %.3f ms" % (len(reader), reader.num_chunks,
+		reader.chunk_size, (time.time() - start_time) * 1e3))
+	full = loadmat(sys.argv[1])['data'][0]
+	for ii in list(range(reader.num_chunks)) + list(range(reader.num_chunks - 1, -1, -1)):
+		chunk = reader[reader.chunk_size*ii:reader.chunk_size*(ii+1)]
+		assert np.array_equal(chunk, full[reader.chunk_size*ii:reader.chunk_size*(ii+1)])
+	print("All chunks match loadmat")
@@ -0,0 +1,164 @@
+#Imports
+import struct
+import numpy as np
+
+#MAT v5 data types and classes we need
+miINT8 = 1
+miUINT16 = 4
+miINT32 = 5
+miUINT32 = 6
+miDOUBLE = 9
+miMATRIX = 14
+mxDOUBLE_CLASS = 6
+mxUINT16_CLASS = 11
+
+#Sample types we can save as (numpy type, MAT data type, MAT class)
+MAT_TYPES = {
+	"<f8": (miDOUBLE, mxDOUBLE_CLASS),
+	"<u2": (miUINT16, mxUINT16_CLASS)
+}
+
+################################################################################
+class Mat_Writer:
+	"""
+	Appends samples to the 'data' row vector of a .mat file as they arrive
+	"""
+	def __init__(self, savefile, header, grow_samps=1 << 20, dtype="<f8"):
+		"""
+		PURPOSE: creates a new .mat file and gets it ready for appending
+		ARGS:
+			savefile (str): full path to '.mat' file to write
+			header (dict): other variables to save (ts_us, chunk_size), these
+				are written once up front
+			grow_samps (int): number of samples to preallocate on disk at a
+				time
+			dtype (str): numpy type to save samples as, '<f8' for volts or
+				'<u2' for raw adc counts
+		RETURNS: new instance of a Mat_Writer
+		NOTES: the file can be loaded with loadmat at any time, even if the
+			process dies, and holds every sample appended so far
+		"""
+		self.savefile = savefile
+		self.grow_samps = int(grow_samps)
+		self.dtype = np.dtype(dtype)
+		if self.dtype.str not in MAT_TYPES:
+			raise ValueError("Can not save samples of type %s" % self.dtype)
+		self.mi_type, self.mx_class = MAT_TYPES[self.dtype.str]
+		self.num_samps = 0
+		self.cap_samps = 0
+
+		#Write the header variables with scipy then add our own data element, 
+		#imported here since scipy is slow to import
+		from scipy.io import savemat
+		savemat(savefile, mdict=header)
+		self.fh = open(savefile, "r+b", buffering=0)
+		self.fh.seek(0, 2)
+		self.mat_pos = self.fh.tell()
+		self.data_pos = self.mat_pos + 56
+		self.fh.write(struct.pack("<IIIIII", miMATRIX, 48, miUINT32, 8, self.mx_class, 0))
+		self.fh.write(self.pack_sizes(0))
+		self.grow()
+
+	############################################################################
+	def pack_sizes(self, num_samps):
+		"""
+		PURPOSE: packs the part of the data element that depends on its length
+		ARGS:
+			num_samps (int): number of valid samples
+		RETURNS: (bytes) dimensions, name and data tag
+		NOTES: these are contiguous so one write updates them together
+		"""
+		return (struct.pack("<IIii", miINT32, 8, 1, num_samps) +
+			struct.pack("<I", (4 << 16) | miINT8) + b"data" +
+			struct.pack("<II", self.mi_type, num_samps * self.dtype.itemsize))
+
+	############################################################################
+	def set_capacity(self, cap_samps):
+		"""
+		PURPOSE: sets how many samples the data element has room for
+		ARGS:
+			cap_samps (int): number of samples
+		RETURNS: none
+		NOTES: space past the valid samples is zero padding that readers skip
+		"""
+		self.fh.seek(self.mat_pos + 4)
+		self.fh.write(struct.pack("<I", 48 + self.padded_len(cap_samps)))
+		self.cap_samps = cap_samps
+
+	############################################################################
+	def padded_len(self, num_samps):
+		"""
+		PURPOSE: gets the number of bytes samples take up in the file
+		ARGS:
+			num_samps (int): number of samples
+		RETURNS: (int) bytes, rounded up to the 8 byte MAT alignment
+		NOTES:
+		"""
+		return -(-num_samps * self.dtype.itemsize // 8) * 8
+
+	############################################################################
+	def file_len(self, num_samps):
+		"""
+		PURPOSE: gets the size the file will be when it holds num_samps samples
+		ARGS:
+			num_samps (int): number of samples
+		RETURNS: (int) bytes once closed, header and other variables included
+		NOTES: while open the file is larger, by the space preallocated
+		"""
+		return self.data_pos + self.padded_len(num_samps)
+
+	############################################################################
+	def grow(self):
+		"""
+		PURPOSE: preallocates more room on disk for samples
+		ARGS: none
+		RETURNS: none
+		NOTES: size is updated before the file is extended, a data element
+			that runs past the end of the file still loads
+		"""
+		cap_samps = self.cap_samps + self.grow_samps
+		self.set_capacity(cap_samps)
+		self.fh.truncate(self.data_pos + self.padded_len(cap_samps))
+
+	############################################################################
+	def append(self, chunk):
+		"""
+		PURPOSE: appends samples to the file
+		ARGS:
+			chunk (numpy array): samples to append
+		RETURNS: none
+		NOTES: samples are on disk (in the os cache) when this returns
+		"""
+		chunk = np.asarray(chunk, dtype=self.dtype).ravel()
+		while self.num_samps + chunk.shape[0] > self.cap_samps:
+			self.grow()
+		self.fh.seek(self.data_pos + self.num_samps * self.dtype.itemsize)
+		self.fh.write(chunk.tobytes())
+		self.num_samps += chunk.shape[0]
+		self.fh.seek(self.mat_pos + 24)
+		self.fh.write(self.pack_sizes(self.num_samps))
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: trims the preallocated space and closes the file
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		if self.fh:
+			self.fh.truncate(self.data_pos + self.padded_len(self.num_samps))
+			self.set_capacity(self.num_samps)
+			self.fh.close()
+			self.fh = None
+
+################################################################################
+if __name__ == "__main__":
+	from scipy.io import loadmat
+
+	writer = Mat_Writer("test_mat_writer.mat", {"ts_us": 200, "chunk_size": 4}, grow_samps=6)
+	for ii in range(4):
+		writer.append(np.arange(4) + 4 * ii)
+		print(loadmat("test_mat_writer.mat")["data"])
+	writer.close()
+	print(loadmat("test_mat_writer.mat"))
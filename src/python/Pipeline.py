@@ -0,0 +1,144 @@
+#Imports
+import numpy as np
+from Processor import Processor
+from Chunk_Saver import Chunk_Saver
+from Sample_Bus import Sample_Bus
+
+################################################################################
+class Pipeline:
+	"""
+	The speed gun's threads, from the arduino (or a recording) through the
+	processor and saver, with nothing to do with the display
+	"""
+	def __init__(self, samp_T_us, cpi_samps, savefile, res_q, replay_file=None, hop_samps=None, to_plot="freq", fft_backend="numpy", fft_workers=1, timing=False, replay_rate=1.0, replay_loops=None, raw_counts=False, baud=115200, ser_port=None, queue_size=16, bus_chunks=64, map_cpis=200, full_res=False):
+		"""
+		PURPOSE: creates a new Pipeline
+		ARGS:
+			samp_T_us (float): sampling period in microseconds
+			cpi_samps (int): number of samples in one cpi
+			savefile (str): the file to save to
+			res_q (Queue): queue the processor puts results on
+			replay_file (str): recording to replay instead of reading the
+				arduino, if None reads the arduino
+			hop_samps (int): number of samples between overlapping cpis, if
+				None cpis do not overlap
+			to_plot (str): what the processor puts in each result, see
+				Processor
+			fft_backend (str): fft library the processor uses
+			fft_workers (int): number of threads per fft
+			timing (bool): if True the processor times each stage
+			replay_rate (float): playback speed when replaying, as a multiple
+				of real time
+			replay_loops (int): number of times to replay the recording, if
+				None loops forever
+			raw_counts (bool): if True the arduino chunks stay as raw adc
+				counts, so they are saved as uint16
+			baud (int): baud rate to ask the arduino for
+			ser_port (str): serial port the arduino (or Arduino_Emulator) is
+				on, will try to find arduino if left as None
+			queue_size (int): most chunks waiting to be processed, the oldest
+				are dropped when processing falls behind, except when
+				replaying as fast as possible
+			bus_chunks (int): number of chunks kept for the processor and
+				saver to read
+			map_cpis (int): number of cpis in the processor's doppler map
+			full_res (bool): if True results hold every sample or fft bin
+		RETURNS: new instance of a Pipeline
+		NOTES: the recorder module is only imported for the source used, so
+			replaying does not need pyserial
+		"""
+		#Setup recorder/replayer, they write each chunk once to a bus that the
+		#processor and saver read from
+		if replay_file != None:
+			from Replayer_2 import Replayer
+			self.recorder = Replayer(replay_file, [], ts_us=samp_T_us, chunk_size=cpi_samps, rate=replay_rate, loops=replay_loops)
+			self.bus = Sample_Bus(cpi_samps, bus_chunks, self.recorder.data.dtype)
+			self.recorder.record_qs = self.bus
+		else:
+			from Chunked_Arduino_ADC_2 import Chunked_Arduino_ADC
+			self.bus = Sample_Bus(cpi_samps, bus_chunks, np.uint16 if raw_counts else np.float64)
+			self.recorder = Chunked_Arduino_ADC(samp_T_us, cpi_samps, self.bus, ser_port=ser_port, raw_counts=raw_counts, baud=baud)
+
+		#Setup queues, the processor skips the oldest chunks when it falls
+		#behind, unless replaying as fast as possible when there is no real
+		#time to keep up with. The saver never drops, the recorder waits for
+		#it instead
+		fast_replay = replay_file != None and not replay_rate
+		self.record_q = self.bus.attach("proc", max_lag=queue_size, never_drop=fast_replay)
+		self.save_q = self.bus.attach("save", never_drop=True)
+		self.res_q = res_q
+		#Setup processor
+		self.proc = Processor(samp_T_us, cpi_samps, self.record_q, self.res_q, to_plot=to_plot, real_fft=True, hop_size=hop_samps,
+			fft_backend=fft_backend, fft_workers=fft_workers, timing=timing, map_cpis=map_cpis, full_res=full_res)
+		#Setup saver
+		self.saver = Chunk_Saver(savefile, samp_T_us, cpi_samps, self.save_q)
+
+	############################################################################
+	def start(self):
+		"""
+		PURPOSE: starts recording and processing
+		ARGS: none
+		RETURNS: none
+		NOTES: the saver is started separately, see 'start_saver'
+		"""
+		self.recorder.start()
+		self.proc.start()
+
+	############################################################################
+	def stop(self):
+		"""
+		PURPOSE: stops recording and processing
+		ARGS: none
+		RETURNS: none
+		NOTES: blocks until the threads stop
+		"""
+		self.recorder.stop()
+		self.proc.stop()
+
+	############################################################################
+	def start_saver(self):
+		"""
+		PURPOSE: starts the saver
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.saver.start()
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: stops every thread
+		ARGS: none
+		RETURNS: none
+		NOTES: blocks until the threads stop
+		"""
+		self.stop()
+		self.saver.stop()
+
+	############################################################################
+	def is_running(self):
+		"""
+		PURPOSE: checks if recording and processing are running
+		ARGS: none
+		RETURNS: True if both are running, False if either stopped
+		NOTES:
+		"""
+		return self.recorder.is_running() and self.proc.is_running()
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the status of every thread and queue
+		ARGS: none
+		RETURNS: dictionary of statuses
+		NOTES:
+		"""
+		status = {
+			"recorder" : self.recorder.get_status(),
+			"proc" : self.proc.get_status(),
+			"saver" : self.saver.get_status(),
+			"bus" : self.bus.get_status(),
+			"res_q" : self.res_q.get_status()
+		}
+		return status
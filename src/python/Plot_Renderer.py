@@ -0,0 +1,180 @@
+#Imports
+import time
+import numpy as np
+
+################################################################################
+class Plot_Renderer:
+	"""
+	Draws processor results on a matplotlib canvas, only redrawing the line
+	(or doppler map image) for each new result
+	"""
+	def __init__(self, canvas, timer=None):
+		"""
+		PURPOSE: creates a new Plot_Renderer
+		ARGS:
+			canvas (MplCanvas): canvas to draw on, with its axes as 'ax'
+			timer (Stage_Timer): if given records how long each frame takes
+				to draw as 'render'
+		RETURNS: new instance of a Plot_Renderer
+		NOTES: the axes, labels and ticks are drawn once and saved as a
+			background, each frame restores it and blits the line or image on
+			top
+		"""
+		self.canvas = canvas
+		self.ax = canvas.ax
+		self.timer = timer
+		self.line = None
+		self.image = None
+		self.artist = None
+		self.layout = None
+		self.x = None
+		self.y = None
+		self.background = None
+		self.canvas.mpl_connect("draw_event", self.on_draw)
+
+	############################################################################
+	def setup(self, res):
+		"""
+		PURPOSE: rebuilds the axes for a new plot layout
+		ARGS:
+			res (Result): result with the new layout
+		RETURNS: none
+		NOTES: does a full draw, which saves the new background
+		"""
+		self.layout = (res["title"], res["xlabel"], res["ylabel"], tuple(res["xlim"]), tuple(res["ylim"]))
+		self.x = res["x"]
+		self.y = np.array(res["y"])
+		self.image = res["image"]
+		ax = self.ax
+		ax.clear()
+		ax.set_xlabel(res["xlabel"])
+		ax.set_ylabel(res["ylabel"])
+		ax.set_title(res["title"])
+		if self.image == None:
+			self.line = ax.plot(self.x, self.y, animated=True)[0]
+			self.artist = self.line
+		else:
+			#Newest row at the bottom, like imagesc of one cpi per row
+			self.line = None
+			self.artist = ax.imshow(self.image.get_image(), extent=(self.x[0], self.x[-1], 0, self.image.num_rows), 
+				aspect="auto", origin="upper", interpolation="nearest", clim=res["clim"], animated=True)
+		ax.set_xlim(res["xlim"][0], res["xlim"][1])
+		ax.set_ylim(res["ylim"][0], res["ylim"][1])
+		self.canvas.draw()
+
+	############################################################################
+	def on_draw(self, event):
+		"""
+		PURPOSE: saves the background after a full draw
+		ARGS:
+			event (DrawEvent): matplotlib draw event
+		RETURNS: none
+		NOTES: full draws happen on setup and when the window is resized
+		"""
+		self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+		if self.artist != None:
+			self.ax.draw_artist(self.artist)
+
+	############################################################################
+	def draw(self, res):
+		"""
+		PURPOSE: draws a result
+		ARGS:
+			res (Result): result to draw
+		RETURNS: none
+		NOTES: the result's data is copied so it can be released right away,
+			an image is shown from its ring without copying
+		"""
+		if self.timer:
+			start_time = time.perf_counter()
+		layout = (res["title"], res["xlabel"], res["ylabel"], tuple(res["xlim"]), tuple(res["ylim"]))
+		if self.artist == None or layout != self.layout or res["image"] is not self.image or self.background == None:
+			self.setup(res)
+		else:
+			if self.image != None:
+				self.artist.set_data(self.image.get_image())
+			elif res["x"] is not self.x or res["y"].shape != self.y.shape:
+				self.x = res["x"]
+				self.y = np.array(res["y"])
+				self.line.set_data(self.x, self.y)
+			else:
+				np.copyto(self.y, res["y"])
+				self.line.set_ydata(self.y)
+			self.canvas.restore_region(self.background)
+			self.ax.draw_artist(self.artist)
+			self.canvas.blit(self.ax.bbox)
+		if self.timer:
+			self.timer.mark("render", start_time)
+
+################################################################################
+if __name__ == "__main__":
+	import matplotlib
+	matplotlib.use("Agg")
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	from Stage_Timer import Stage_Timer
+	from Ring_Image import Ring_Image
+
+	#Fake results like the processor's full resolution velocity plot, 
+	#8193 real fft bins of a 2500 sample cpi up to 79.7 mph
+	x = np.linspace(0, 79.7, 8193)
+	layout = {"x": x, "xlabel": "Velocity (mph)", "ylabel": "Magnitude (Linear)",
+		"title": "Signal Velocities", "xlim": (0, 50), "ylim": (0, 13), "image": None}
+	results = [dict(layout, y=np.random.rayleigh(0.5, x.shape[0])) for ii in range(50)]
+
+	#Old path: clear the axes and draw everything each frame
+	fig = Figure()
+	canvas = FigureCanvasAgg(fig)
+	ax = fig.add_subplot(111)
+	start_time = time.perf_counter()
+	for res in results:
+		ax.clear()
+		ax.plot(res["x"], res["y"])
+		ax.set_xlabel(res["xlabel"])
+		ax.set_ylabel(res["ylabel"])
+		ax.set_title(res["title"])
+		ax.set_xlim(res["xlim"][0], res["xlim"][1])
+		ax.set_ylim(res["ylim"][0], res["ylim"][1])
+		canvas.draw()
+	print("clear and redraw %8.2f ms/frame" % ((time.perf_counter() - start_time) / len(results) * 1e3))
+
+	#New path
+	fig = Figure()
+	canvas = FigureCanvasAgg(fig)
+	canvas.ax = fig.add_subplot(111)
+	timer = Stage_Timer()
+	renderer = Plot_Renderer(canvas, timer)
+	renderer.draw(results[0])
+	timer.reset()
+	start_time = time.perf_counter()
+	for res in results:
+		renderer.draw(res)
+	print("blit, full res   %8.2f ms/frame (max %.2f ms)" % ((time.perf_counter() - start_time) / len(results) * 1e3,
+		timer.get_stats()["render"]["max_us"] / 1e3))
+
+	#Decimated like the processor sends by default, 467 min/max columns
+	x = np.repeat(np.linspace(0, 50, 467), 2)
+	layout = dict(layout, x=x)
+	small = [dict(layout, y=np.random.rayleigh(0.5, x.shape[0])) for ii in range(50)]
+	renderer.draw(small[0])
+	timer.reset()
+	start_time = time.perf_counter()
+	for res in small:
+		renderer.draw(res)
+	print("blit, decimated  %8.2f ms/frame (max %.2f ms)" % ((time.perf_counter() - start_time) / len(small) * 1e3,
+		timer.get_stats()["render"]["max_us"] / 1e3))
+
+	#Doppler map, one new row per frame, the processor combines the 5140
+	#bins of a 2500 sample cpi into 467 columns
+	x = np.linspace(0, 50, 467)
+	image = Ring_Image(200, x.shape[0])
+	layout = {"x": x, "xlabel": "Velocity (mph)", "ylabel": "CPIs Ago", "title": "Doppler Map",
+		"xlim": (0, 50), "ylim": (0, 200), "image": image, "clim": (0, 13)}
+	renderer.draw(dict(layout, y=x))
+	timer.reset()
+	start_time = time.perf_counter()
+	for res in results:
+		image.push(res["y"][-x.shape[0]:])
+		renderer.draw(dict(layout, y=x))
+	print("doppler map      %8.2f ms/frame (max %.2f ms, %dx%d image)" % ((time.perf_counter() - start_time) / len(results) * 1e3,
+		timer.get_stats()["render"]["max_us"] / 1e3, image.num_rows, image.num_cols))
@@ -1,16 +1,25 @@
 #Imports
 import threading
 import queue
+import time
 import numpy as np
 from My_Utils import *
-from scipy.constants import c
+from Sliding_Window import Sliding_Window
+from Result_Pool import Result_Pool
+from FFT_Backend import FFT_Backend
+from Stage_Timer import Stage_Timer
+from Ring_Image import Ring_Image
+from Sample_Bus import Bus_Reader
+
+#Speed of light (m/s)
+c = 299792458.0
 
 ################################################################################
 class Processor:
 	"""
 	The processing chain for the heart rate variability application
 	"""
-	def __init__(self, ts_us, chunk_size, record_q, res_q, to_plot="freq"):
+	def __init__(self, ts_us, chunk_size, record_q, res_q, to_plot="freq", real_fft=False, win_size=None, hop_size=None, res_slots=4, fft_backend="numpy", fft_workers=1, nfft_pad=2, timing=False, map_cpis=200, disp_cols=512, full_res=False):
 		"""
 		PURPOSE: creates a new HRV_Processor
 		ARGS:
@@ -18,65 +27,221 @@ class Processor:
 			chunk_size (int): number of samples in one processing chunk
 			record_q (Queue): queue to pull chunks from
 			res_q (Queue): queue to write results to
-			to_plot (str): what to plot, options: raw, freq
+			to_plot (str): what to plot, options: raw, freq, map (doppler map 
+				of the latest cpis), none (results only carry the detection)
+			real_fft (bool): if True only computes the non-negative half of 
+				the spectrum since the IF signal is real
+			win_size (int): number of samples in one cpi when streaming, 
+				defaults to chunk_size
+			hop_size (int): number of samples between cpis when streaming, if 
+				None each chunk is processed as its own cpi
+			res_slots (int): number of preallocated result slots, results are 
+				dropped if the consumer holds all of them
+			fft_backend (str): fft library to use, see FFT_Backend
+			fft_workers (int): number of threads per fft
+			nfft_pad (int): fft size is 2 ** (nextpow2(win_size) + nfft_pad)
+			timing (bool or Stage_Timer): if True records how long each 
+				stage takes, see 'get_status'. A Stage_Timer is used as is, 
+				to choose its settings
+			map_cpis (int): number of cpis shown in the doppler map
+			disp_cols (int): most columns across a plot, neighbouring bins or 
+				samples are combined into one column (min and max for the 
+				line plots, max for the doppler map) to fit
+			full_res (bool): if True the raw and velocity plots get every 
+				sample or bin instead of the decimated columns
 		RETURNS: new instance of a Processor
-		NOTES:
+		NOTES: see 'set_window' to change the streaming parameters and 
+			'set_plot' to change what is plotted at runtime, results put on 
+			res_q must be released by the consumer
 		"""
 		#Save arguments
 		self.ts_us = ts_us
 		self.ts = ts_us / 1e6
 		self.fs = 1 / self.ts
+		self.chunk_size = int(chunk_size)
 		self.res_q = res_q
 		self.record_q = record_q
 		self.to_plot = to_plot
-
-		#Initialize other variables
-		nfft = 2 ** (nextpow2(chunk_size) + 2);
-		self.nfft = nfft
-		self.f = np.linspace(-nfft / 2.0, nfft / 2.0 - 1, num=nfft) * (self.fs / nfft)
-		self.t = np.arange(start=0, stop=self.ts*chunk_size, step=self.ts)
+		self.real_fft = real_fft
+		self.fft = FFT_Backend(fft_backend, fft_workers)
+		self.nfft_pad = int(nfft_pad)
+		self.timer = None
+		if isinstance(timing, Stage_Timer):
+			self.timer = timing
+		elif timing:
+			self.timer = Stage_Timer()
 		self.fc = 10.525e9;
 		self.c = c;
-		self.v = self.f * c / 2 / self.fc;
+
+		#Velocities shown in the spectrum and doppler map
+		self.max_mph = 50
+		self.map_cpis = int(map_cpis)
+		self.disp_cols = int(disp_cols)
+		self.full_res = full_res
+
+		#Detection threshold on cpi energy
+		self.det_thresh = 0.2070
+
+		#Scale of raw adc counts (10 bit adc, 5 V reference)
+		self.volts_per_count = 5 / 1023
+
+		#Setup processing thread variables
+		self.proc_thread = None
+		self.proc_keep_going = threading.Event()
+		self.proc_keep_going.clear()
+		self.proc_lock = threading.RLock()
+
+		#Setup result slots
+		self.res_slots = int(res_slots)
+		self.res_dropped = 0
+		self.cpi_num = 0
+
+		#Setup cpi window, axes, filter and result dictionary
+		self.set_window(win_size, hop_size)
+
+	############################################################################
+	def set_window(self, win_size=None, hop_size=None, overlap=None):
+		"""
+		PURPOSE: sets the streaming window parameters
+		ARGS:
+			win_size (int): number of samples in one cpi, defaults to 
+				chunk_size
+			hop_size (int): number of samples between cpis, if None and 
+				overlap is None each chunk is processed as its own cpi
+			overlap (int): number of samples shared by consecutive cpis, only 
+				used if hop_size is None
+		RETURNS: none
+		NOTES: safe to call while running, the rolling buffer starts over
+		"""
+		if win_size == None:
+			win_size = self.chunk_size
+		win_size = int(win_size)
+		if hop_size == None and overlap != None:
+			hop_size = win_size - int(overlap)
+
+		with self.proc_lock:
+			self.win_size = win_size
+			if hop_size == None:
+				self.hop_size = None
+				self.window = None
+			else:
+				self.hop_size = int(hop_size)
+				self.window = Sliding_Window(self.win_size, self.hop_size)
+			self.setup_axes()
+			self.setup_res_dict()
+
+	############################################################################
+	def set_plot(self, to_plot):
+		"""
+		PURPOSE: sets what is plotted
+		ARGS:
+			to_plot (str): what to plot, see the constructor
+		RETURNS: none
+		NOTES: safe to call while running, the next cpi uses the new plot
+		"""
+		with self.proc_lock:
+			self.to_plot = to_plot
+			self.setup_res_dict()
+
+	############################################################################
+	def setup_axes(self):
+		"""
+		PURPOSE: computes the time and velocity axes and the filter for the 
+			current window size
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		nfft = 2 ** (nextpow2(self.win_size) + self.nfft_pad);
+		self.nfft = nfft
+		if self.real_fft:
+			self.f = np.arange(nfft // 2 + 1) * (self.fs / nfft)
+		else:
+			self.f = np.linspace(-nfft / 2.0, nfft / 2.0 - 1, num=nfft) * (self.fs / nfft)
+		self.t = np.arange(self.win_size) * self.ts
+		self.v = self.f * self.c / 2 / self.fc;
 		self.v_mph = self.v / 0.44704;
 
 		#Create high pass filter
 		high_pass_cutoff_mph = 6;
-		high_pass_cutoff = 2 * high_pass_cutoff_mph * 0.44704 * self.fc / c;
-		self.filter = np.zeros(nfft, dtype=np.cfloat)
+		high_pass_cutoff = 2 * high_pass_cutoff_mph * 0.44704 * self.fc / self.c;
+		if self.real_fft:
+			self.filter = np.zeros(self.f.shape[0])
+		else:
+			self.filter = np.zeros(nfft, dtype=np.complex128)
 		self.filter[np.where(self.f <= -high_pass_cutoff)] = 1
 		self.filter[np.where(self.f >= high_pass_cutoff)] = 1
 
-		#Setup processing thread variables
-		self.proc_thread = None
-		self.proc_keep_going = threading.Event()
-		self.proc_keep_going.clear()
+		#Bins between 0 and max_mph, the only ones plotted. Groups of 
+		#band_bin neighbouring bins become one display column, a few bins 
+		#past the last whole group are left off
+		start = int(np.searchsorted(self.v_mph, 0))
+		stop = int(np.searchsorted(self.v_mph, self.max_mph, side="right"))
+		self.band_bin = max(1, -(-(stop - start) // self.disp_cols))
+		stop = start + (stop - start) // self.band_bin * self.band_bin
+		self.band = slice(start, stop)
+		self.band_mag = np.zeros(stop - start)
+		self.band_x = self.v_mph[self.band].reshape(-1, self.band_bin).mean(axis=1)
 
-		#Setup result dictionary
-		self.setup_res_dict()
+		#Samples in each display column of the raw plot
+		self.raw_bin = max(1, -(-self.win_size // self.disp_cols))
+		self.raw_len = self.win_size // self.raw_bin * self.raw_bin
+		self.raw_x = (self.t[:self.raw_len] * 1e3).reshape(-1, self.raw_bin).mean(axis=1)
 
 	############################################################################
 	def setup_res_dict(self):
-		self.res = {
-			"cpi_num": 0,
-			"eng": 0,
-			"detc": False,
-			"vel": 0
-		}
-		if self.to_plot == "freq":
-			self.res["x"] = self.v_mph
-			self.res["xlabel"] = "Velocity (mph)"
-			self.res["ylabel"] = "Magnitude (Linear)"
-			self.res["title"] = "Signal Velocities"
-			self.res["xlim"] = (0, 50)
-			self.res["ylim"] = (0, 13)
-		else:
-			self.res["x"] = self.t * 1e3
-			self.res["xlabel"] = "Time (ms)"
-			self.res["ylabel"] = "Voltage"
-			self.res["title"] = "Raw Signal"
-			self.res["xlim"] = (0, 500)
-			self.res["ylim"] = (-2.5, 2.5)
+		"""
+		PURPOSE: sets up the plot layout and the pool of result slots
+		ARGS: none
+		RETURNS: none
+		NOTES: call again after changing 'full_res' ('set_plot' calls it), slots 
+			still held by a consumer from the old pool are simply dropped 
+			when released. The x axis is shared by every slot, each result 
+			only carries its y values. The line plots get a min and a max 
+			per display column, both at the column's x
+		"""
+		with self.proc_lock:
+			if self.to_plot == "freq":
+				self.res = {
+					"x": self.v_mph if self.full_res else np.repeat(self.band_x, 2),
+					"xlabel": "Velocity (mph)",
+					"ylabel": "Magnitude (Linear)",
+					"title": "Signal Velocities",
+					"xlim": (0, self.max_mph),
+					"ylim": (0, 13)
+				}
+			elif self.to_plot == "map":
+				#Each cpi's row is written into the image in place, so the
+				#history is kept even when the display skips results
+				self.res = {
+					"x": self.band_x,
+					"xlabel": "Velocity (mph)",
+					"ylabel": "CPIs Ago",
+					"title": "Doppler Map",
+					"xlim": (0, self.max_mph),
+					"ylim": (0, self.map_cpis),
+					"image": Ring_Image(self.map_cpis, self.band_x.shape[0]),
+					"clim": (0, 13)
+				}
+			elif self.to_plot == "none":
+				self.res = {
+					"x": np.zeros(0),
+					"xlabel": "",
+					"ylabel": "",
+					"title": "",
+					"xlim": (0, 1),
+					"ylim": (0, 1)
+				}
+			else:
+				self.res = {
+					"x": self.t * 1e3 if self.full_res else np.repeat(self.raw_x, 2),
+					"xlabel": "Time (ms)",
+					"ylabel": "Voltage",
+					"title": "Raw Signal",
+					"xlim": (0, self.win_size * self.ts * 1e3),
+					"ylim": (-2.5, 2.5)
+				}
+			self.res_pool = Result_Pool(self.res_slots, self.res["x"].shape[0], self.res, np.float32)
 
 	############################################################################
 	def __del__(self):
@@ -129,11 +294,15 @@ class Processor:
 		PURPOSE: gets the status of this thread
 		ARGS: none
 		RETURNS: dictionary of statuses
-		NOTES:
+		NOTES: if timing is enabled 'timing' holds the statistics of each 
+			stage and of the time between chunks (see Stage_Timer)
 		"""
 		status = {
-			"running" : self.is_running()
+			"running" : self.is_running(),
+			"res_dropped" : self.res_dropped
 		}
+		if self.timer:
+			status["timing"] = self.timer.get_stats()
 		return status
 
 	############################################################################
@@ -146,7 +315,7 @@ class Processor:
 		"""
 		#Indicate processor is running
 		self.proc_keep_going.set()
-		cpi_num = 0
+		self.cpi_num = 0
 
 		try:
 			#Run until told to stop
@@ -156,30 +325,113 @@ class Processor:
 					chunk = self.record_q.get(timeout=0.1)
 				except queue.Empty as e:
 					continue
-				sig = self.remove_dc(chunk)
-				eng = self.compute_energy(sig)
-				detc = self.detect(eng)
-				hsig = self.filter_sig(sig)
-				vel = self.compute_velocity(hsig)
-				if not detc:
-					vel = 0
-				self.res["cpi_num"] = cpi_num
-				self.res["eng"] = eng
-				self.res["detc"] = detc
-				self.res["vel"] = vel
-				if self.to_plot == "freq":
-					self.res["y"] = abs(hsig)
-				else:
-					self.res["y"] = sig
-					#self.res["ylim"] = (np.min(sig), np.max(sig))
-				cpi_num += 1
-				self.res_q.put(self.res)
+				if self.timer:
+					self.timer.interval("chunk_interval")
+				with self.proc_lock:
+					if self.window == None:
+						self.process_cpi(chunk)
+					else:
+						if self.window.buf.dtype != chunk.dtype:
+							#Keep raw adc counts as counts in the window
+							self.window = Sliding_Window(self.win_size, self.hop_size, chunk.dtype)
+						for win in self.window.push(chunk):
+							self.process_cpi(win)
+				self.record_q.task_done()
 		except Exception as e:
 			print("ERROR: 'processor thread' got exception %s" % type(e))
 			print(e)
 			self.proc_keep_going.clear()
 
-		#Cleanup
+		#Cleanup, stop holding up the bus writer now nothing reads
+		if isinstance(self.record_q, Bus_Reader):
+			self.record_q.close()
+
+	############################################################################
+	def process_cpi(self, chunk):
+		"""
+		PURPOSE: processes one cpi and puts the result on the result queue
+		ARGS:
+			chunk (numpy array): samples in the cpi
+		RETURNS: none
+		NOTES: the result is written into a free slot from the result pool
+		"""
+		#The plot and its result pool change together, see 'set_plot'
+		with self.proc_lock:
+			to_plot = self.to_plot
+			res_layout = self.res
+			res_pool = self.res_pool
+		timer = self.timer
+		if timer:
+			t = time.perf_counter()
+		sig = self.remove_dc(chunk)
+		if timer:
+			t = timer.mark("remove_dc", t)
+		eng = self.compute_energy(sig)
+		if timer:
+			t = timer.mark("compute_energy", t)
+		detc = self.detect(eng)
+		if timer:
+			t = timer.mark("detect", t)
+		hsig = self.filter_sig(sig)
+		if timer:
+			t = timer.mark("filter_sig", t)
+		vel = self.compute_velocity(hsig)
+		if timer:
+			t = timer.mark("compute_velocity", t)
+		if not detc:
+			vel = 0
+		if to_plot == "map":
+			#Every cpi goes in the doppler map, even if its result is dropped
+			image = res_layout["image"]
+			row = image.claim()
+			np.abs(hsig[self.band], out=self.band_mag)
+			np.max(self.band_mag.reshape(-1, self.band_bin), axis=1, out=row)
+			image.commit()
+		res = res_pool.acquire()
+		if res == None:
+			#Consumer is holding every slot so drop this result
+			self.res_dropped += 1
+		else:
+			res.cpi_num = self.cpi_num
+			res.eng = eng
+			res.detc = detc
+			res.vel = vel
+			if to_plot == "freq":
+				if self.full_res:
+					np.abs(hsig, out=res.y)
+				else:
+					np.abs(hsig[self.band], out=self.band_mag)
+					self.min_max(self.band_mag, self.band_bin, res.y)
+			elif to_plot == "map":
+				res.y[:] = row
+			elif to_plot == "none":
+				pass
+			elif self.full_res:
+				res.y[:] = sig
+			else:
+				self.min_max(sig[:self.raw_len], self.raw_bin, res.y)
+			self.res_q.put(res)
+		if timer:
+			timer.mark("publish", t)
+		self.cpi_num += 1
+
+	############################################################################
+	def min_max(self, sig, bin_size, out):
+		"""
+		PURPOSE: shrinks a signal to display size keeping its peaks
+		ARGS:
+			sig (numpy array): signal, a whole number of bins long
+			bin_size (int): number of values in each display column
+			out (numpy array): where to write the min and max of each column, 
+				2 * len(sig) / bin_size long
+		RETURNS: none
+		NOTES: values are written min, max, min, max..., so drawing them as a 
+			line shows the whole range of each column
+		"""
+		cols = sig.reshape(-1, bin_size)
+		pairs = out.reshape(-1, 2)
+		np.min(cols, axis=1, out=pairs[:, 0])
+		np.max(cols, axis=1, out=pairs[:, 1])
 
 	############################################################################
 	def remove_dc(self, sig):
@@ -187,10 +439,13 @@ class Processor:
 		PURPOSE: removes the dc from the signal
 		ARGS:
 			sig (numpy array): signal to filter
-		RETURNS: numpy array representing filtered signal
-		NOTES:
+		RETURNS: numpy array representing filtered signal (volts)
+		NOTES: works on a single cpi or a matrix with one cpi per row, raw adc 
+			counts (integer types) are converted to volts here
 		"""
-		return sig - np.mean(sig);
+		if sig.dtype.kind in "ui":
+			return (sig - np.mean(sig, axis=-1, keepdims=True)) * self.volts_per_count
+		return sig - np.mean(sig, axis=-1, keepdims=True)
 
 	############################################################################
 	def compute_energy(self, sig):
@@ -198,10 +453,10 @@ class Processor:
 		PURPOSE: computes the energy in the signal
 		ARGS:
 			sig (numpy array): signal to filter
-		RETURNS: (float) energy
-		NOTES:
+		RETURNS: (float) energy, or array of energies for a matrix of cpis
+		NOTES: works on a single cpi or a matrix with one cpi per row
 		"""
-		return np.sum(np.abs(sig) ** 2)
+		return np.sum(np.abs(sig) ** 2, axis=-1)
 
 	############################################################################
 	def detect(self, eng):
@@ -210,12 +465,9 @@ class Processor:
 		ARGS:
 			eng (float): energy in signal
 		RETURNS: (bool) True for deteciton, False if not
-		NOTES:
+		NOTES: if eng is an array, returns a boolean array
 		"""
-		thresh = 0.2070
-		if eng > thresh:
-			return True
-		return False
+		return eng > self.det_thresh
 
 	############################################################################
 	def filter_sig(self, sig):
@@ -224,10 +476,14 @@ class Processor:
 		ARGS:
 			sig (numpy array): signal to filter
 		RETURNS: numpy array representing filtered signal in frequency domain
-		NOTES:
+		NOTES: works on a single cpi or a matrix with one cpi per row, in real 
+			fft mode only the non-negative half is returned and it is not 
+			shifted
 		"""
 		#Convert to frequency space
-		H = np.fft.fftshift(np.fft.fft(sig, n=self.nfft))
+		H = self.fft.fft(sig, self.nfft, real=self.real_fft)
+		if not self.real_fft:
+			H = np.fft.fftshift(H, axes=-1)
 		#Apply filter
 		return H * self.filter
 
@@ -237,17 +493,80 @@ class Processor:
 		PURPOSE: computes the velocity of the signal
 		ARGS:
 			sig (numpy array): signal in frequency domain
-		RETURNS: (float) velocity
-		NOTES:
+		RETURNS: (float) velocity, or array of velocities for a matrix of cpis
+		NOTES: works on a single cpi or a matrix with one cpi per row
 		"""
-		idx = np.argmax(abs(sig))
+		idx = np.argmax(abs(sig), axis=-1)
 		return abs(self.v_mph[idx])
 
+	############################################################################
+	def process_batch(self, data, block_size=256):
+		"""
+		PURPOSE: processes a whole recording at once instead of cpi by cpi
+		ARGS:
+			data (numpy array): recorded samples, any trailing partial cpi is 
+				ignored
+			block_size (int): number of cpis to transform at once, bounds the 
+				memory used by the 2-D fft
+		RETURNS: dictionary of per cpi result arrays (cpi_num, eng, detc, vel)
+		NOTES: same math as 'run' but done as matrix operations, one cpi per 
+			row, like data/try_to_detect_car.m, cpis overlap if a hop size 
+			is set
+		"""
+		#View as a matrix with one cpi per row (no copy)
+		data = np.ascontiguousarray(data).ravel()
+		hop_size = self.hop_size if self.hop_size else self.win_size
+		num_cpis = max(0, (data.shape[0] - self.win_size) // hop_size + 1)
+		chunks = np.lib.stride_tricks.as_strided(data, shape=(num_cpis, self.win_size), 
+			strides=(hop_size * data.strides[0], data.strides[0]), writeable=False)
+
+		#Allocate results
+		res = {
+			"cpi_num": np.arange(num_cpis),
+			"eng": np.zeros(num_cpis),
+			"detc": np.zeros(num_cpis, dtype=bool),
+			"vel": np.zeros(num_cpis)
+		}
+
+		#Process a block of cpis at a time
+		for start in range(0, num_cpis, block_size):
+			stop = min(start + block_size, num_cpis)
+			sig = self.remove_dc(chunks[start:stop])
+			eng = self.compute_energy(sig)
+			detc = self.detect(eng)
+			hsig = self.filter_sig(sig)
+			vel = self.compute_velocity(hsig)
+			vel[~detc] = 0
+			res["eng"][start:stop] = eng
+			res["detc"][start:stop] = detc
+			res["vel"][start:stop] = vel
+
+		return res
+
 ################################################################################
 if __name__ == "__main__":
+	import argparse
 	import time
-	import matplotlib.pyplot as plt
+	from scipy.io import loadmat
+
+	parser = argparse.ArgumentParser(description="Batch Processor")
+	parser.add_argument("savefile", type=str, help=".mat file to process")
+	parser.add_argument("-r", "--real_fft", help="Use the real fft", action="store_true", default=False)
+	parser.add_argument("-f", "--fft", type=str, help="FFT backend", default="numpy")
+	parser.add_argument("-w", "--workers", type=int, help="Threads per FFT", default=1)
+	args = parser.parse_args()
+
+	saved_data = loadmat(args.savefile)
+	ts_us = saved_data['ts_us'][0][0]
+	chunk_size = saved_data['chunk_size'][0][0]
+	data = saved_data['data'][0]
 
-	
+	proc = Processor(ts_us, chunk_size, None, None, real_fft=args.real_fft, fft_backend=args.fft, fft_workers=args.workers)
+	start_time = time.time()
+	res = proc.process_batch(data)
+	elapsed_time = time.time() - start_time
 
-	
\ No newline at end of file
+	for ii in np.where(res["detc"])[0]:
+		print("CPI = %d, Energy = %.4f, Velocity = %.2f mph" % (res["cpi_num"][ii], res["eng"][ii], res["vel"][ii]))
+	num_cpis = res["cpi_num"].shape[0]
+	print("Processed %d CPIs (%.1f s of data) in %.3f s" % (num_cpis, num_cpis * chunk_size * ts_us / 1e6, elapsed_time))
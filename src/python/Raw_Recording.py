@@ -0,0 +1,193 @@
+#Imports
+import json
+import struct
+import time
+import numpy as np
+from Mat_Writer import Mat_Writer
+from Mat_Reader import Mat_Reader
+
+#Raw recordings start with this, then the header length and a json header
+MAGIC = b"DOPRAW1\n"
+HEADER_ALIGN = 512
+
+################################################################################
+class Raw_Writer:
+	"""
+	Appends samples to a raw recording, a small json header followed by the
+	samples exactly as they are in memory
+	"""
+	def __init__(self, savefile, ts_us, chunk_size, dtype="<f8", start_time=None):
+		"""
+		PURPOSE: creates a new raw recording
+		ARGS:
+			savefile (str): full path to '.raw' file to write
+			ts_us (float): sampling period (microseconds)
+			chunk_size (int): number of samples in one chunk
+			dtype (str): numpy type the samples are stored as
+			start_time (float): unix time of the first sample, defaults to now
+		RETURNS: new instance of a Raw_Writer
+		NOTES: the number of samples is not stored, it comes from the file
+			size, so the file is readable at any time even if the process dies
+		"""
+		if start_time == None:
+			start_time = time.time()
+		self.savefile = savefile
+		self.dtype = np.dtype(dtype)
+		self.num_samps = 0
+		header = {
+			"ts_us": float(ts_us),
+			"chunk_size": int(chunk_size),
+			"dtype": self.dtype.str,
+			"start_time": float(start_time)
+		}
+		header = json.dumps(header).encode()
+		header_len = -(-(len(MAGIC) + 4 + len(header)) // HEADER_ALIGN) * HEADER_ALIGN
+		header = MAGIC + struct.pack("<I", header_len) + header
+		self.header_len = header_len
+		self.fh = open(savefile, "wb", buffering=0)
+		self.fh.write(header + b" " * (header_len - len(header)))
+
+	############################################################################
+	def append(self, chunk):
+		"""
+		PURPOSE: appends samples to the file
+		ARGS:
+			chunk (numpy array): samples to append
+		RETURNS: none
+		NOTES:
+		"""
+		chunk = np.asarray(chunk, dtype=self.dtype).ravel()
+		self.fh.write(chunk.tobytes())
+		self.num_samps += chunk.shape[0]
+
+	############################################################################
+	def file_len(self, num_samps):
+		"""
+		PURPOSE: gets the size the file will be when it holds num_samps samples
+		ARGS:
+			num_samps (int): number of samples
+		RETURNS: (int) bytes, header included
+		NOTES:
+		"""
+		return self.header_len + num_samps * self.dtype.itemsize
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: closes the file
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		if self.fh:
+			self.fh.close()
+			self.fh = None
+
+################################################################################
+def open_raw(savefile):
+	"""
+	PURPOSE: opens a raw recording without reading its samples
+	ARGS:
+		savefile (str): '.raw' file to open
+	RETURNS: tuple of (header dictionary, read only numpy memmap of samples)
+	NOTES: a partially written last sample is ignored
+	"""
+	with open(savefile, "rb") as fh:
+		if fh.read(len(MAGIC)) != MAGIC:
+			raise ValueError("%s is not a raw recording" % savefile)
+		header_len = struct.unpack("<I", fh.read(4))[0]
+		header = json.loads(fh.read(header_len - len(MAGIC) - 4).decode())
+		fh.seek(0, 2)
+		file_len = fh.tell()
+	dtype = np.dtype(header["dtype"])
+	num_samps = (file_len - header_len) // dtype.itemsize
+	if num_samps == 0:
+		return (header, np.zeros(0, dtype=dtype))
+	data = np.memmap(savefile, dtype=dtype, mode="r", offset=header_len, shape=(num_samps,))
+	return (header, data)
+
+################################################################################
+def load_recording(savefile, lazy=False, chunk_size=None):
+	"""
+	PURPOSE: opens a recording in the .mat or .raw format, or a list of 
+		segments written by Chunk_Saver_2
+	ARGS:
+		savefile (str): recording or segment manifest ('.json') to open
+		lazy (bool): if True .mat files are read a chunk at a time when 
+			sliced (see Mat_Reader) instead of all up front
+		chunk_size (int): number of samples per read for lazy .mat files, if 
+			None uses the value in the file
+	RETURNS: tuple of (ts_us, chunk_size, data)
+	NOTES: raw recordings are always memory mapped, .mat files that can not 
+		be read lazily (compressed) are read into memory
+	"""
+	if savefile.endswith(".raw"):
+		header, data = open_raw(savefile)
+		return (header["ts_us"], header["chunk_size"], data)
+	if savefile.endswith(".json"):
+		#Imported here since the segment reader uses this function
+		from Segment_Manifest import Segment_Reader
+		reader = Segment_Reader(savefile, chunk_size)
+		return (reader.ts_us, reader.chunk_size, reader)
+	if lazy:
+		try:
+			reader = Mat_Reader(savefile, chunk_size)
+			return (reader.ts_us, reader.file_chunk_size, reader)
+		except ValueError as e:
+			pass
+	#Imported here since scipy is slow to import
+	from scipy.io import loadmat
+	saved_data = loadmat(savefile)
+	return (saved_data['ts_us'][0][0], saved_data['chunk_size'][0][0], saved_data['data'][0])
+
+################################################################################
+def mat_to_raw(matfile, rawfile, dtype=None):
+	"""
+	PURPOSE: converts a .mat recording to a raw recording
+	ARGS:
+		matfile (str): .mat file to read
+		rawfile (str): .raw file to write
+		dtype (str): numpy type to store the samples as, if None raw adc 
+			counts stay uint16 and anything else is saved as doubles
+	RETURNS: none
+	NOTES:
+	"""
+	ts_us, chunk_size, data = load_recording(matfile)
+	if dtype == None:
+		dtype = "<u2" if data.dtype == np.uint16 else "<f8"
+	writer = Raw_Writer(rawfile, ts_us, chunk_size, dtype)
+	writer.append(data)
+	writer.close()
+
+################################################################################
+def raw_to_mat(rawfile, matfile, block_samps=1 << 20):
+	"""
+	PURPOSE: converts a raw recording to a .mat recording
+	ARGS:
+		rawfile (str): .raw file to read
+		matfile (str): .mat file to write
+		block_samps (int): number of samples to convert at a time
+	RETURNS: none
+	NOTES: samples are saved like Chunk_Saver does, raw adc counts as uint16 
+		and anything else as doubles
+	"""
+	header, data = open_raw(rawfile)
+	dtype = "<u2" if data.dtype == np.uint16 else "<f8"
+	writer = Mat_Writer(matfile, {'ts_us': header["ts_us"], 'chunk_size': header["chunk_size"]}, dtype=dtype)
+	for ii in range(0, data.shape[0], block_samps):
+		writer.append(data[ii:ii+block_samps])
+	writer.close()
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Convert between .mat and .raw recordings")
+	parser.add_argument("infile", type=str, help="Recording to convert")
+	parser.add_argument("outfile", type=str, help="Recording to write (.mat or .raw)")
+	args = parser.parse_args()
+
+	if args.outfile.endswith(".raw"):
+		mat_to_raw(args.infile, args.outfile)
+	else:
+		raw_to_mat(args.infile, args.outfile)
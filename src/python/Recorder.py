@@ -1,7 +1,9 @@
 #Imports
-import queue
 import Chunked_Arduino_ADC
 import Chunk_Saver
+import Chunk_Saver_2
+from Bounded_Queue import Bounded_Queue, NEVER_DROP
+import os
 import time
 
 ################################################################################
@@ -19,7 +21,7 @@ class Recorder:
 		pass
 
 	############################################################################
-	def record(self, savefile, ts_us=200, chunk_size=2500, ser_port=None):
+	def record(self, savefile, ts_us=200, chunk_size=2500, ser_port=None, raw_counts=False, seg_secs=None, baud=115200):
 		"""
 		PURPOSE: records data to matlab file
 		ARGS:
@@ -28,12 +30,21 @@ class Recorder:
 			chunk_size (int): the size of the chunks the arduino is sending
 			ser_port (str): the serial port to listen on  (will search on its 
 				own if its None)
+			raw_counts (bool): if True saves raw adc counts (uint16) instead 
+				of volts
+			seg_secs (float): if set, starts a new numbered file every this 
+				many seconds and lists them in '<savefile>_manifest.json'
+			baud (int): baud rate to ask the arduino for
 		RETURNS: none
 		NOTES:
 		"""
-		record_q = queue.Queue()
-		adc = Chunked_Arduino_ADC.Chunked_Arduino_ADC(ts_us, chunk_size, record_q, ser_port)
-		saver = Chunk_Saver.Chunk_Saver(savefile, ts_us, chunk_size, record_q)
+		record_q = Bounded_Queue(policy=NEVER_DROP)
+		adc = Chunked_Arduino_ADC.Chunked_Arduino_ADC(ts_us, chunk_size, record_q, ser_port, raw_counts, baud)
+		if seg_secs:
+			savefile, file_ext = os.path.splitext(savefile)
+			saver = Chunk_Saver_2.Chunk_Saver(savefile, ts_us, chunk_size, record_q, file_ext or ".mat", seg_secs=seg_secs)
+		else:
+			saver = Chunk_Saver.Chunk_Saver(savefile, ts_us, chunk_size, record_q)
 
 		print("Starting recorder...")
 
@@ -52,7 +63,13 @@ class Recorder:
 				print("-------------------------")
 				print("ADC Connected = %s" % bool(adc_status["connected"]))
 				print("ADC Receiving Data = %s" % bool(adc_status["receiving_data"]))
+				print("ADC Resyncs = %d, Dropped Bytes = %d, Misaligned Frames = %d" % (adc_status["resyncs"],
+					adc_status["dropped_bytes"], adc_status["misaligned_frames"]))
+				print("ADC Packed = %s, Bad Checksums = %d, Lost Frames = %d" % (adc_status["packed"],
+					adc_status["bad_checksums"], adc_status["lost_frames"]))
 				print("Chunk Count = %d" % saver_status["chunk_count"])
+				q_status = record_q.get_status()
+				print("Queue Size = %d, Max = %d" % (q_status["size"], q_status["high_water"]))
 				print("-------------------------")
 				if not adc_status["running"]:
 					print("ERROR: ADC stopped unexpectedly!")
@@ -83,7 +100,10 @@ if __name__ == "__main__":
 	parser.add_argument("-t", "--ts_us", type=int, help="Sampling period (us)", default=200)
 	parser.add_argument("-c", "--chunk_size", type=int, help="Samples per chunk", default=2500)
 	parser.add_argument("-s", "--ser_port", type=str, help="Serial port to listen on", default=None)
+	parser.add_argument("-r", "--raw_counts", help="Save raw ADC counts", action="store_true", default=False)
+	parser.add_argument("-b", "--baud", type=int, help="Serial baud rate", default=115200)
+	parser.add_argument("--seg_secs", type=float, help="Start a new file every this many seconds", default=None)
 	args = parser.parse_args()
 
 	recorder = Recorder()
-	recorder.record(args.savefile, args.ts_us, args.chunk_size, args.ser_port)
\ No newline at end of file
+	recorder.record(args.savefile, args.ts_us, args.chunk_size, args.ser_port, args.raw_counts, args.seg_secs, args.baud)
\ No newline at end of file
@@ -2,7 +2,7 @@
 import threading
 import queue
 import math
-from scipy.io import loadmat
+from Raw_Recording import load_recording
 import time
 
 ################################################################################
@@ -10,26 +10,31 @@ class Replayer:
 	"""
 	Replays recorded files as if they were being sampled in real time
 	"""
-	def __init__(self, savefile, record_q, ts_us=None, chunk_size=None):
+	def __init__(self, savefile, record_q, ts_us=None, chunk_size=None, rate=1.0, loops=None):
 		"""
 		PURPOSE: creates a new Replayer
 		ARGS:
-			savefile (str): the .mat file containing the saved data
+			savefile (str): the .mat or .raw file containing the saved data
 			record_q (Queue): the queue to put the chunks in
 			ts_us (int): the sampling period (microseconds), if left as None it 
 				uses the value in the save file
 			chunk_size (int): the number of samples in one chunk, if left as 
 				None it uses the value in the save file
+			rate (float): playback speed as a multiple of real time, 0 or None 
+				replays as fast as possible
+			loops (int): number of times to play the file before stopping, if 
+				None loops forever
 		RETURNS: new instance of a replayer
-		NOTES:
+		NOTES: .raw files are memory mapped so chunks are slices of the file 
+			and only the pages replayed are read, .mat files are read a few 
+			chunks at a time (see Mat_Reader)
 		"""
 		#Save arguments and load file
 		self.record_q = record_q
 		self.savefile = savefile
-		saved_data = loadmat(savefile)
-		self.ts_us = saved_data['ts_us'][0][0]
-		self.chunk_size = saved_data['chunk_size'][0][0]
-		self.data = saved_data['data'][0]
+		self.rate = rate
+		self.loops = loops
+		self.ts_us, self.chunk_size, self.data = load_recording(savefile, lazy=True, chunk_size=chunk_size)
 		if ts_us != None:
 			self.ts_us = ts_us
 		if chunk_size != None:
@@ -39,6 +44,8 @@ class Replayer:
 		self.replay_thread = None
 		self.replay_keep_going = threading.Event()
 		self.replay_keep_going.clear()
+		self.replay_wake = threading.Event()
+		self.chunks_sent = 0
 
 		#Compute variables used to chunk the data
 		self.num_chunks = int(math.floor(self.data.shape[0] / self.chunk_size))
@@ -65,6 +72,7 @@ class Replayer:
 		NOTES:
 		"""
 		if self.replay_thread == None or not self.is_running():
+			self.replay_wake.clear()
 			self.replay_thread = threading.Thread(target = self.run)
 			self.replay_thread.start()
 
@@ -78,6 +86,7 @@ class Replayer:
 		"""
 		if self.replay_thread:
 			self.replay_keep_going.clear()
+			self.replay_wake.set()
 			self.replay_thread.join()
 			self.replay_thread = None
 
@@ -102,7 +111,8 @@ class Replayer:
 		status = {
 			"running" : self.is_running(),
 			"connected" : True,
-			"receiving_data" : True
+			"receiving_data" : True,
+			"chunks_sent" : self.chunks_sent
 		}
 		return status
 
@@ -120,22 +130,33 @@ class Replayer:
 		try:
 			#Run until told to stop
 			ii = 0
-			prev_time = time.time() - 1
+			loop_num = 0
+			num_sent = 0
+			start_time = time.perf_counter()
 			while self.is_running():
-				cur_time = time.time()
-				if (cur_time - prev_time) >= (4 * self.chunk_time):
-					chunk = self.data[self.chunk_size*ii:self.chunk_size*(ii+1)]
-					self.record_q.put(chunk)
-					ii += 1
-					if ii >= self.num_chunks:
-						ii = 0
-					prev_time = cur_time
-				time.sleep(0.1)
+				#Wait until this chunk is due
+				if self.rate:
+					delay = start_time + num_sent * self.chunk_time / self.rate - time.perf_counter()
+					if delay > 0 and self.replay_wake.wait(delay):
+						continue
+				chunk = self.data[self.chunk_size*ii:self.chunk_size*(ii+1)]
+				self.record_q.put(chunk)
+				self.chunks_sent += 1
+				num_sent += 1
+				ii += 1
+				if ii >= self.num_chunks:
+					ii = 0
+					loop_num += 1
+					if self.loops != None and loop_num >= self.loops:
+						break
 		except Exception as e:
 			print("ERROR: 'replay thread' got exception %s" % type(e))
 			print(e)
 			self.replay_keep_going.clear()
 
+		#Indicate we are done (when the file ran out)
+		self.replay_keep_going.clear()
+
 	############################################################################
 
 ################################################################################
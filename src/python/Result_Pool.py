@@ -0,0 +1,113 @@
+#Imports
+import queue
+import numpy as np
+
+################################################################################
+class Result:
+	"""
+	One processing result slot, filled by the processor and handed to a
+	consumer which must 'release' it when done
+	"""
+	__slots__ = ("pool", "cpi_num", "eng", "detc", "vel", "y", "x", "xlabel",
+		"ylabel", "title", "xlim", "ylim", "image", "clim")
+
+	def __init__(self, pool, y_len, layout, dtype=np.float64):
+		"""
+		PURPOSE: creates a new Result
+		ARGS:
+			pool (Result_Pool): pool this slot belongs to
+			y_len (int): number of points in the plotted signal
+			layout (dict): static plot values (x, xlabel, ylabel, title,
+				xlim, ylim and for image plots image, clim) shared by every
+				slot
+			dtype (numpy dtype): type of the plotted signal
+		RETURNS: new instance of a Result
+		NOTES:
+		"""
+		self.pool = pool
+		self.cpi_num = 0
+		self.eng = 0
+		self.detc = False
+		self.vel = 0
+		self.y = np.zeros(y_len, dtype=dtype)
+		self.image = None
+		self.clim = None
+		for key in layout:
+			setattr(self, key, layout[key])
+
+	############################################################################
+	def __getitem__(self, key):
+		"""
+		PURPOSE: lets a result be read like the old result dictionary
+		ARGS:
+			key (str): name of the field
+		RETURNS: value of the field
+		NOTES:
+		"""
+		return getattr(self, key)
+
+	############################################################################
+	def release(self):
+		"""
+		PURPOSE: gives this slot back to its pool so it can be refilled
+		ARGS: none
+		RETURNS: none
+		NOTES: the slot must not be used after it is released
+		"""
+		self.pool.release(self)
+
+################################################################################
+class Result_Pool:
+	"""
+	Fixed set of preallocated result slots that are recycled between the
+	processor and its consumer
+	"""
+	def __init__(self, num_slots, y_len, layout, dtype=np.float64):
+		"""
+		PURPOSE: creates a new Result_Pool
+		ARGS:
+			num_slots (int): number of result slots
+			y_len (int): number of points in the plotted signal
+			layout (dict): static plot values shared by every slot
+			dtype (numpy dtype): type of the plotted signal
+		RETURNS: new instance of a Result_Pool
+		NOTES:
+		"""
+		self.num_slots = int(num_slots)
+		self.free_q = queue.Queue()
+		for ii in range(self.num_slots):
+			self.free_q.put(Result(self, y_len, layout, dtype))
+
+	############################################################################
+	def acquire(self):
+		"""
+		PURPOSE: gets a free slot to fill
+		ARGS: none
+		RETURNS: a Result, or None if every slot is held by a consumer
+		NOTES: never blocks
+		"""
+		try:
+			return self.free_q.get_nowait()
+		except queue.Empty as e:
+			return None
+
+	############################################################################
+	def release(self, res):
+		"""
+		PURPOSE: returns a slot to the pool
+		ARGS:
+			res (Result): slot to return
+		RETURNS: none
+		NOTES:
+		"""
+		self.free_q.put(res)
+
+	############################################################################
+	def num_free(self):
+		"""
+		PURPOSE: gets the number of slots not held by a consumer
+		ARGS: none
+		RETURNS: (int) number of free slots
+		NOTES:
+		"""
+		return self.free_q.qsize()
@@ -0,0 +1,90 @@
+#Imports
+import threading
+import numpy as np
+
+################################################################################
+class Ring_Image:
+	"""
+	Fixed size image of the newest rows written, like a scrolling
+	spectrogram, that never reallocates or copies its history
+	"""
+	def __init__(self, num_rows, num_cols, dtype=np.float32):
+		"""
+		PURPOSE: creates a new Ring_Image
+		ARGS:
+			num_rows (int): number of rows kept (the image height)
+			num_cols (int): number of values in one row
+			dtype (numpy dtype): type of the values
+		RETURNS: new instance of a Ring_Image
+		NOTES: every row is stored twice, at i and i + num_rows, so the
+			newest num_rows rows are always one contiguous slice
+		"""
+		self.num_rows = int(num_rows)
+		self.num_cols = int(num_cols)
+		self.buf = np.zeros((2 * self.num_rows, self.num_cols), dtype=dtype)
+		self.dtype = self.buf.dtype
+		self.lock = threading.Lock()
+		self.written = 0
+
+	############################################################################
+	def claim(self):
+		"""
+		PURPOSE: gets the slot the next row goes in, to write it in place
+		ARGS: none
+		RETURNS: writable numpy array for the next row
+		NOTES: the row is not part of the image until 'commit' is called
+		"""
+		return self.buf[self.written % self.num_rows]
+
+	############################################################################
+	def commit(self):
+		"""
+		PURPOSE: adds the row written into the claimed slot to the image
+		ARGS: none
+		RETURNS: none
+		NOTES: the oldest row scrolls off
+		"""
+		ii = self.written % self.num_rows
+		self.buf[ii + self.num_rows] = self.buf[ii]
+		with self.lock:
+			self.written += 1
+
+	############################################################################
+	def push(self, row):
+		"""
+		PURPOSE: copies a row into the image
+		ARGS:
+			row (numpy array): num_cols values
+		RETURNS: none
+		NOTES:
+		"""
+		self.claim()[:] = row
+		self.commit()
+
+	############################################################################
+	def get_image(self):
+		"""
+		PURPOSE: gets the newest rows
+		ARGS: none
+		RETURNS: read only (num_rows, num_cols) numpy array, oldest row first
+		NOTES: a view into the ring (no copy) that scrolls as rows are
+			written, get it again after each row. The oldest row may be
+			mid write. Rows not yet written are zeros
+		"""
+		with self.lock:
+			ii = self.written % self.num_rows
+		image = self.buf[ii:ii+self.num_rows].view()
+		image.flags.writeable = False
+		return image
+
+	############################################################################
+	def clear(self):
+		"""
+		PURPOSE: blanks the image
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		with self.lock:
+			self.buf[:] = 0
+			self.written = 0
@@ -0,0 +1,263 @@
+#Imports
+import threading
+import queue
+import numpy as np
+
+################################################################################
+class Sample_Bus:
+	"""
+	Ring buffer of chunks written once by one producer and read by any number
+	of consumers, each at its own pace
+	"""
+	def __init__(self, chunk_size, num_chunks=64, dtype=np.float64):
+		"""
+		PURPOSE: creates a new Sample_Bus
+		ARGS:
+			chunk_size (int): number of samples in one chunk
+			num_chunks (int): number of chunks the ring holds (at least 3), a
+				reader that falls num_chunks - 2 behind loses chunks, unless
+				it never drops, then the writer waits for it
+			dtype (numpy dtype): type of the samples
+		RETURNS: new instance of a Sample_Bus
+		NOTES: memory is allocated once, adding readers costs no copies
+		"""
+		self.chunk_size = int(chunk_size)
+		self.num_chunks = int(num_chunks)
+		if self.num_chunks < 3:
+			raise ValueError("A Sample_Bus needs at least 3 chunks")
+		self.buf = np.zeros((self.num_chunks, self.chunk_size), dtype=dtype)
+		self.dtype = self.buf.dtype
+		self.cond = threading.Condition()
+		self.written = 0
+		self.readers = []
+		self.stalls = 0
+
+	############################################################################
+	def attach(self, name=None, max_lag=None, never_drop=False):
+		"""
+		PURPOSE: adds a consumer
+		ARGS:
+			name (str): name shown in the status
+			max_lag (int): most unread chunks before the oldest are skipped,
+				if None only chunks the ring has overwritten are lost
+			never_drop (bool): if True the writer waits rather than let
+				this reader fall num_chunks - 2 behind, so it sees every
+				chunk. max_lag is ignored
+		RETURNS: new Bus_Reader, starting at the next chunk written
+		NOTES: a never drop reader holds up the writer until it is closed,
+			so close it when it stops reading
+		"""
+		with self.cond:
+			if name == None:
+				name = "reader_%d" % len(self.readers)
+			reader = Bus_Reader(self, name, None if never_drop else max_lag, never_drop)
+			self.readers.append(reader)
+		return reader
+
+	############################################################################
+	def claim(self):
+		"""
+		PURPOSE: gets the slot the next chunk goes in, to write it in place
+		ARGS: none
+		RETURNS: writable numpy array for the next chunk
+		NOTES: readers do not see it until 'commit' is called. Blocks while
+			a never drop reader is num_chunks - 2 behind, each wait is
+			counted as a stall
+		"""
+		with self.cond:
+			if not self.has_room():
+				self.stalls += 1
+				self.cond.wait_for(self.has_room)
+			return self.buf[self.written % self.num_chunks]
+
+	############################################################################
+	def has_room(self):
+		"""
+		PURPOSE: checks if the next chunk can be written without a never drop
+			reader losing one
+		ARGS: none
+		RETURNS: True if there is room, False if the writer must wait
+		NOTES: call with cond held
+		"""
+		for reader in self.readers:
+			if reader.never_drop and self.written - reader.cursor >= reader.max_lag:
+				return False
+		return True
+
+	############################################################################
+	def commit(self):
+		"""
+		PURPOSE: publishes the chunk written into the claimed slot
+		ARGS: none
+		RETURNS: none
+		NOTES: wakes any waiting readers
+		"""
+		with self.cond:
+			self.written += 1
+			self.cond.notify_all()
+
+	############################################################################
+	def put(self, chunk):
+		"""
+		PURPOSE: copies a chunk onto the bus
+		ARGS:
+			chunk (numpy array): chunk_size samples
+		RETURNS: none
+		NOTES: named like Queue.put so the bus can stand in for a queue,
+			blocks like 'claim'
+		"""
+		self.claim()[:] = chunk
+		self.commit()
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the bus counters
+		ARGS: none
+		RETURNS: dictionary of counters, with one entry per reader
+		NOTES:
+		"""
+		status = {"written" : self.written, "stalls" : self.stalls}
+		for reader in list(self.readers):
+			status[reader.name] = reader.get_status()
+		return status
+
+################################################################################
+class Bus_Reader:
+	"""
+	One consumer's view of a Sample_Bus, used like a queue, including
+	calling 'task_done' when finished with each chunk
+	"""
+	def __init__(self, bus, name, max_lag=None, never_drop=False):
+		"""
+		PURPOSE: creates a new Bus_Reader
+		ARGS:
+			bus (Sample_Bus): bus to read
+			name (str): name shown in the status
+			max_lag (int): most unread chunks before the oldest are skipped
+			never_drop (bool): if True the writer waits for this reader
+		RETURNS: new instance of a Bus_Reader
+		NOTES: use Sample_Bus.attach instead of calling this
+		"""
+		self.bus = bus
+		self.name = name
+		self.never_drop = never_drop
+		#The slot after the newest chunk may be mid write, and the oldest
+		#chunk handed out needs a slot of room while it is used, so at most
+		#num_chunks - 2 chunks can be waiting
+		self.max_lag = bus.num_chunks - 2
+		if max_lag != None:
+			self.max_lag = max(1, min(int(max_lag), self.max_lag))
+		self.cursor = bus.written
+		self.held = None
+		self.read = 0
+		self.skipped = 0
+		self.overruns = 0
+
+	############################################################################
+	def qsize(self):
+		"""
+		PURPOSE: gets the number of chunks waiting to be read
+		ARGS: none
+		RETURNS: (int) number of chunks
+		NOTES:
+		"""
+		return min(self.bus.written - self.cursor, self.max_lag)
+
+	############################################################################
+	def get(self, block=True, timeout=None):
+		"""
+		PURPOSE: gets the next chunk
+		ARGS:
+			block (bool): if True waits for a chunk
+			timeout (float): most seconds to wait, None waits forever
+		RETURNS: read only numpy array of samples
+		NOTES: raises queue.Empty like Queue.get. The array is a view into
+			the ring so it is only good until the writer laps this reader,
+			copy it to keep it longer. Call 'task_done' when finished with it
+			to check it was not overwritten while in use
+		"""
+		bus = self.bus
+		with bus.cond:
+			if block:
+				if not bus.cond.wait_for(lambda: bus.written > self.cursor, timeout):
+					raise queue.Empty
+			elif bus.written <= self.cursor:
+				raise queue.Empty
+
+			#Skip chunks we fell too far behind on
+			lag = bus.written - self.cursor
+			if lag > self.max_lag:
+				lost = lag - self.max_lag
+				overrun = lag - (bus.num_chunks - 1)
+				if overrun > 0:
+					self.overruns += overrun
+					lost -= overrun
+				self.skipped += lost
+				self.cursor = bus.written - self.max_lag
+			chunk = bus.buf[self.cursor % bus.num_chunks]
+			self.held = self.cursor
+			self.cursor += 1
+			self.read += 1
+			#Wake a writer waiting for this reader
+			if self.never_drop:
+				bus.cond.notify_all()
+		chunk = chunk.view()
+		chunk.flags.writeable = False
+		return chunk
+
+	############################################################################
+	def task_done(self):
+		"""
+		PURPOSE: marks the last chunk from 'get' as finished with
+		ARGS: none
+		RETURNS: none
+		NOTES: named like Queue.task_done. If the writer has started on the
+			chunk's slot since it was handed out it was changed while in
+			use, which is counted as an overrun
+		"""
+		if self.held != None:
+			if self.bus.written >= self.held + self.bus.num_chunks:
+				self.overruns += 1
+			self.held = None
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: stops this reader holding up the writer
+		ARGS: none
+		RETURNS: none
+		NOTES: for never drop readers that have stopped reading, chunks
+			written afterwards may be lost like any other reader's
+		"""
+		with self.bus.cond:
+			self.never_drop = False
+			self.bus.cond.notify_all()
+
+	############################################################################
+	def get_nowait(self):
+		"""
+		PURPOSE: gets the next chunk without waiting
+		ARGS: none
+		RETURNS: read only numpy array of samples
+		NOTES: raises queue.Empty if there isn't one
+		"""
+		return self.get(block=False)
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the reader counters
+		ARGS: none
+		RETURNS: dictionary of counters
+		NOTES: overruns are chunks the ring overwrote before they were read
+			or while they were in use, skipped are chunks dropped to stay
+			within max_lag
+		"""
+		status = {
+			"read" : self.read,
+			"lag" : self.bus.written - self.cursor,
+			"skipped" : self.skipped,
+			"overruns" : self.overruns
+		}
+		return status
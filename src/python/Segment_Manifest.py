@@ -0,0 +1,235 @@
+#Imports
+import os
+import json
+import threading
+import collections
+import numpy as np
+from Raw_Recording import load_recording
+from Mat_Reader import Mat_Reader
+
+################################################################################
+class Segment_Manifest:
+	"""
+	Keeps a json list of the segment files of a recording, in order
+	"""
+	def __init__(self, manifest_file, ts_us, chunk_size):
+		"""
+		PURPOSE: creates a new Segment_Manifest
+		ARGS:
+			manifest_file (str): full path to the '.json' manifest
+			ts_us (int): sampling period (microseconds)
+			chunk_size (int): number of samples in one chunk
+		RETURNS: new instance of a Segment_Manifest
+		NOTES: replaces any existing manifest once the first segment is added
+		"""
+		self.manifest_file = manifest_file
+		self.lock = threading.Lock()
+		self.manifest = {"ts_us": ts_us, "chunk_size": chunk_size, "segments": []}
+
+	############################################################################
+	def add_segment(self, savefile, start_time):
+		"""
+		PURPOSE: adds a segment that is being written
+		ARGS:
+			savefile (str): full path to the segment file
+			start_time (float): unix time of the first sample
+		RETURNS: none
+		NOTES:
+		"""
+		with self.lock:
+			self.manifest["segments"].append({
+				"file": os.path.relpath(savefile, os.path.dirname(os.path.abspath(self.manifest_file))),
+				"start_time": start_time,
+				"num_samps": 0,
+				"complete": False
+			})
+			self.write()
+
+	############################################################################
+	def finish_segment(self, savefile, num_samps):
+		"""
+		PURPOSE: marks a segment as completely written
+		ARGS:
+			savefile (str): full path to the segment file
+			num_samps (int): number of samples in the segment
+		RETURNS: none
+		NOTES:
+		"""
+		name = os.path.relpath(savefile, os.path.dirname(os.path.abspath(self.manifest_file)))
+		with self.lock:
+			for seg in self.manifest["segments"]:
+				if seg["file"] == name:
+					seg["num_samps"] = int(num_samps)
+					seg["complete"] = True
+			self.write()
+
+	############################################################################
+	def write(self):
+		"""
+		PURPOSE: saves the manifest
+		ARGS: none
+		RETURNS: none
+		NOTES: writes a temporary file and renames it so the manifest on disk
+			is never half written
+		"""
+		tmp_file = self.manifest_file + ".tmp"
+		with open(tmp_file, "w") as f:
+			json.dump(self.manifest, f, indent=1)
+		os.replace(tmp_file, self.manifest_file)
+
+################################################################################
+class Segment_Reader:
+	"""
+	Reads the segments listed in a manifest as one continuous recording
+	"""
+	def __init__(self, manifest_file, chunk_size=None, max_open=8):
+		"""
+		PURPOSE: creates a new Segment_Reader
+		ARGS:
+			manifest_file (str): '.json' manifest written by Chunk_Saver_2
+			chunk_size (int): number of samples per read for .mat segments, if
+				None uses the value in the manifest
+			max_open (int): most segment files kept open at once
+		RETURNS: new instance of a Segment_Reader
+		NOTES: segments are opened lazily (see load_recording) when a slice
+			first touches them, and the least recently used is closed once
+			more than max_open are open. The sample type is the first
+			segment's
+		"""
+		#Setup open segments first so a manifest that fails to load cleans up
+		self.open_segs = collections.OrderedDict()
+		self.max_open = max(1, int(max_open))
+		self.read_chunk_size = chunk_size
+
+		with open(manifest_file) as f:
+			manifest = json.load(f)
+		self.ts_us = manifest["ts_us"]
+		self.chunk_size = manifest["chunk_size"]
+		seg_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+		#Find where each segment starts, only opening the ones the manifest
+		#does not have the length of
+		self.files = []
+		self.starts = [0]
+		for seg in manifest["segments"]:
+			savefile = os.path.join(seg_dir, seg["file"])
+			if not os.path.exists(savefile):
+				continue
+			if seg["complete"]:
+				num_samps = seg["num_samps"]
+			else:
+				#Still being written, or the saver stopped before finishing it
+				data = load_recording(savefile, lazy=True, chunk_size=chunk_size)[2]
+				num_samps = len(data)
+				self.close_segment(data)
+			if not num_samps:
+				continue
+			self.files.append(savefile)
+			self.starts.append(self.starts[-1] + num_samps)
+		self.shape = (self.starts[-1],)
+		self.dtype = np.dtype(self.get_segment(0).dtype if self.files else np.float64)
+
+	############################################################################
+	def __del__(self):
+		"""
+		PURPOSE: performs any necessary cleanup
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.close()
+
+	############################################################################
+	def close(self):
+		"""
+		PURPOSE: closes every open segment
+		ARGS: none
+		RETURNS: none
+		NOTES: segments are opened again if sliced afterwards
+		"""
+		while self.open_segs:
+			self.close_segment(self.open_segs.popitem()[1])
+
+	############################################################################
+	def close_segment(self, data):
+		"""
+		PURPOSE: closes one segment
+		ARGS:
+			data (Mat_Reader or numpy array): segment from load_recording
+		RETURNS: none
+		NOTES: a memory mapped .raw segment's file closes once nothing
+			references it, including slices already handed out
+		"""
+		if isinstance(data, Mat_Reader):
+			data.close()
+
+	############################################################################
+	def get_segment(self, ii):
+		"""
+		PURPOSE: gets a segment, opening it if needed
+		ARGS:
+			ii (int): index of the segment
+		RETURNS: the segment's samples, see load_recording
+		NOTES:
+		"""
+		data = self.open_segs.get(ii)
+		if data is None:
+			data = load_recording(self.files[ii], lazy=True, chunk_size=self.read_chunk_size)[2]
+			self.open_segs[ii] = data
+			while len(self.open_segs) > self.max_open:
+				self.close_segment(self.open_segs.popitem(last=False)[1])
+		else:
+			self.open_segs.move_to_end(ii)
+		return data
+
+	############################################################################
+	def __len__(self):
+		"""
+		PURPOSE: gets the number of samples
+		ARGS: none
+		RETURNS: (int) number of samples in every segment
+		NOTES:
+		"""
+		return self.shape[0]
+
+	############################################################################
+	def __getitem__(self, key):
+		"""
+		PURPOSE: gets a range of samples, like slicing an array
+		ARGS:
+			key (slice): samples to get, step must be 1
+		RETURNS: numpy array of samples
+		NOTES: a slice inside one segment is passed straight to it
+		"""
+		start, stop, step = key.indices(self.shape[0])
+		if step != 1:
+			raise IndexError("Only contiguous slices are supported")
+		parts = []
+		for ii in range(len(self.files)):
+			seg_start = self.starts[ii]
+			seg_stop = self.starts[ii+1]
+			if seg_stop <= start or seg_start >= stop:
+				continue
+			parts.append(self.get_segment(ii)[max(start, seg_start)-seg_start:min(stop, seg_stop)-seg_start])
+		if len(parts) == 1:
+			return parts[0]
+		if not parts:
+			return np.zeros(0, dtype=self.dtype)
+		return np.concatenate(parts)
+
+	############################################################################
+	def __array__(self, dtype=None, copy=None):
+		"""
+		PURPOSE: reads every sample into memory
+		ARGS:
+			dtype (numpy dtype): type to convert to
+			copy (bool): unused, always returns a new array
+		RETURNS: numpy array of samples
+		NOTES: copied a segment at a time so only max_open stay open
+		"""
+		data = np.zeros(self.shape, dtype=self.dtype)
+		for ii in range(len(self.files)):
+			data[self.starts[ii]:self.starts[ii+1]] = self.get_segment(ii)[:]
+		if dtype != None:
+			data = data.astype(dtype, copy=False)
+		return data
@@ -0,0 +1,92 @@
+#Imports
+import numpy as np
+
+################################################################################
+class Sliding_Window:
+	"""
+	Rolling sample buffer that hands out overlapping windows without copying
+	"""
+	def __init__(self, win_size, hop_size, dtype=np.float64):
+		"""
+		PURPOSE: creates a new Sliding_Window
+		ARGS:
+			win_size (int): number of samples in one window
+			hop_size (int): number of new samples between windows
+			dtype (numpy dtype): type of the samples stored
+		RETURNS: new instance of a Sliding_Window
+		NOTES: every sample is written twice, win_size apart, so the latest
+			window is always one contiguous slice of the buffer
+		"""
+		#Save arguments
+		self.win_size = int(win_size)
+		self.hop_size = int(hop_size)
+		if self.win_size <= 0 or self.hop_size <= 0:
+			raise ValueError("Window and hop size must be positive")
+
+		#Setup buffer
+		self.buf = np.zeros(2 * self.win_size, dtype=dtype)
+		self.reset()
+
+	############################################################################
+	def reset(self):
+		"""
+		PURPOSE: forgets all samples in the buffer
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.pos = 0
+		self.count = 0
+		self.next_emit = self.win_size
+
+	############################################################################
+	def write(self, samples):
+		"""
+		PURPOSE: writes samples into the buffer
+		ARGS:
+			samples (numpy array): samples to write
+		RETURNS: none
+		NOTES:
+		"""
+		while len(samples):
+			num = min(len(samples), self.win_size - self.pos)
+			self.buf[self.pos:self.pos+num] = samples[:num]
+			self.buf[self.pos+self.win_size:self.pos+self.win_size+num] = samples[:num]
+			self.pos = (self.pos + num) % self.win_size
+			self.count += num
+			samples = samples[num:]
+
+	############################################################################
+	def window(self):
+		"""
+		PURPOSE: gets the latest window of samples
+		ARGS: none
+		RETURNS: numpy array view of the last win_size samples, oldest first
+		NOTES: the view is only valid until the next write
+		"""
+		return self.buf[self.pos:self.pos+self.win_size]
+
+	############################################################################
+	def push(self, chunk):
+		"""
+		PURPOSE: adds a chunk of samples and yields every window that completes
+		ARGS:
+			chunk (numpy array): new samples, can be any length
+		RETURNS: generator of windows (see 'window')
+		NOTES: windows must be used before the generator is advanced
+		"""
+		ii = 0
+		while ii < len(chunk):
+			num = min(len(chunk) - ii, self.next_emit - self.count)
+			self.write(chunk[ii:ii+num])
+			ii += num
+			if self.count == self.next_emit:
+				self.next_emit += self.hop_size
+				yield self.window()
+
+################################################################################
+if __name__ == "__main__":
+	win = Sliding_Window(8, 3)
+	for chunk in np.split(np.arange(20), 4):
+		for w in win.push(chunk):
+			print(w)
@@ -3,20 +3,18 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from mplwidget import MplWidget
 from UI import Ui_MainWindow
 import sys
-import threading
 import queue
-import time
-from Chunked_Arduino_ADC_2 import Chunked_Arduino_ADC
-from Replayer_2 import Replayer
-from Processor import Processor
-from Chunk_Saver import Chunk_Saver
+from Pipeline import Pipeline
+from Bounded_Queue import Bounded_Queue, LATEST
+from Plot_Renderer import Plot_Renderer
+from Stage_Timer import Stage_Timer
 
 ################################################################################
 class Speed_Gun:
 	"""
 	Main controller class for the Speed Gun application
 	"""
-	def __init__(self, samp_T_us, cpi_samps, savefile, emulate=False):
+	def __init__(self, samp_T_us, cpi_samps, savefile, emulate=False, hop_samps=None, fft_backend="numpy", fft_workers=1, timing=False, replay_rate=1.0, raw_counts=False, baud=115200, ser_port=None, queue_size=16, bus_chunks=64, refresh_hz=20, map_cpis=200, full_res=False):
 		"""
 		PURPOSE: creates a new Speed_Gun
 		ARGS: 
@@ -25,6 +23,27 @@ class Speed_Gun:
 			emulate (bool): if True loads pre-recorded data, if False runs for 
 				real
 			savefile (str): the file to save to
+			hop_samps (int): number of samples between overlapping cpis, if 
+				None cpis do not overlap
+			fft_backend (str): fft library the processor uses
+			fft_workers (int): number of threads per fft
+			timing (bool): if True shows processing stage and plot frame times 
+				in the status bar
+			replay_rate (float): playback speed when emulating, as a multiple 
+				of real time
+			raw_counts (bool): if True the arduino chunks stay as raw adc 
+				counts, so they are saved as uint16
+			baud (int): baud rate to ask the arduino for
+			ser_port (str): serial port the arduino (or Arduino_Emulator) is
+				on, will try to find arduino if left as None
+			queue_size (int): most chunks waiting to be processed, the oldest
+				are dropped when processing falls behind
+			bus_chunks (int): number of chunks kept for the processor and
+				saver to read
+			refresh_hz (float): how often the display shows the newest result
+			map_cpis (int): number of cpis shown in the doppler map
+			full_res (bool): if True plots every sample or fft bin instead 
+				of a display sized min/max of them
 		RETURNS: new instance of a Speed_Gun
 		NOTES:
 		"""
@@ -49,27 +68,35 @@ class Speed_Gun:
 		self.ui.stop_button.clicked.connect(self.stop_button_clicked)
 		self.ui.vel_radbutton.toggled.connect(self.rad_button_toggled)
 		self.ui.raw_sig_radbutton.toggled.connect(self.rad_button_toggled)
+		self.ui.map_radbutton.toggled.connect(self.rad_button_toggled)
 
-		#Setup queues
-		self.record_q = queue.Queue()
-		self.res_q = queue.Queue()
-		self.save_q = queue.Queue()
-
-		#Setup other modules
-		#Setup recorder.replayer
+		#Setup other modules, the display only needs the newest result
+		replay_file = None
 		if emulate:
-			self.recorder = Replayer("C:\\Users\\rga0230\\Documents\\School\\EE-137\\EE-137-Doppler-Radar\\data\\car.mat", [self.record_q, self.save_q], ts_us=samp_T_us, chunk_size=cpi_samps)
-		else:
-			self.recorder = Chunked_Arduino_ADC(samp_T_us, cpi_samps, [self.record_q, self.save_q])
-		#Setup processor
-		self.proc = Processor(samp_T_us, cpi_samps, self.record_q, self.res_q)
-		#Setup saver
-		self.saver = Chunk_Saver(savefile, samp_T_us, cpi_samps, self.save_q)
+			replay_file = "C:\\Users\\rga0230\\Documents\\School\\EE-137\\EE-137-Doppler-Radar\\data\\car.mat"
+		self.res_q = Bounded_Queue(policy=LATEST, on_drop=lambda res: res.release())
+		self.pipeline = Pipeline(samp_T_us, cpi_samps, savefile, self.res_q, replay_file=replay_file, hop_samps=hop_samps, 
+			fft_backend=fft_backend, fft_workers=fft_workers, timing=timing, replay_rate=replay_rate, raw_counts=raw_counts, 
+			baud=baud, ser_port=ser_port, queue_size=queue_size, bus_chunks=bus_chunks, map_cpis=map_cpis, full_res=full_res)
+		self.recorder = self.pipeline.recorder
+		self.record_q = self.pipeline.record_q
+		self.save_q = self.pipeline.save_q
+		self.proc = self.pipeline.proc
+		self.saver = self.pipeline.saver
+
+		#Setup plot, which times each frame along with the processor
+		self.render_timer = Stage_Timer() if timing else None
+		self.renderer = Plot_Renderer(self.ui.disp_plot.canvas, self.render_timer)
 
-		#Setup variables for our update thread
-		self.update_thread = threading.Thread(target = self.update_thread_run)
-		self.update_keep_going = threading.Event()
-		self.update_keep_going.set()
+		#Setup timers, these run in the GUI thread. The display shows the
+		#newest result each refresh however fast cpis arrive
+		self.stale_frames = 0
+		self.refresh_timer = QtCore.QTimer()
+		self.refresh_timer.setInterval(int(round(1000 / refresh_hz)))
+		self.refresh_timer.timeout.connect(self.refresh_display)
+		self.status_timer = QtCore.QTimer()
+		self.status_timer.setInterval(1000)
+		self.status_timer.timeout.connect(self.poll_status)
 
 	############################################################################
 	def run_app(self):
@@ -79,17 +106,19 @@ class Speed_Gun:
 		RETURNS: none
 		NOTES:
 		"""
-		#Start update thread
-		self.update_thread.start()
+		#Start saver and display timers
+		self.pipeline.start_saver()
+		self.refresh_timer.start()
+		self.status_timer.start()
 
 		#Run GUI
 		self.main_win.show()
 		rc = self.app.exec_()
 
-		#Join update thread
-		self.update_keep_going.clear()
-		self.update_thread.join()
-		self.update_thread = None
+		#Cleanup
+		self.refresh_timer.stop()
+		self.status_timer.stop()
+		self.pipeline.close()
 
 		#Return GUI exit code
 		return rc
@@ -117,11 +146,11 @@ class Speed_Gun:
 	############################################################################
 	def rad_button_toggled(self):
 		if self.ui.vel_radbutton.isChecked():
-			self.proc.to_plot = "freq"
-			self.proc.setup_res_dict()
+			self.proc.set_plot("freq")
+		elif self.ui.map_radbutton.isChecked():
+			self.proc.set_plot("map")
 		else:
-			self.proc.to_plot = "raw"
-			self.proc.setup_res_dict()
+			self.proc.set_plot("raw")
 
 	############################################################################
 	def run_button_clicked(self):
@@ -134,8 +163,7 @@ class Speed_Gun:
 		self.ui.run_button.setEnabled(False)
 		self.ui.stop_button.setEnabled(True)
 
-		self.recorder.start()
-		self.proc.start()
+		self.pipeline.start()
 
 	############################################################################
 	def stop_button_clicked(self):
@@ -146,83 +174,104 @@ class Speed_Gun:
 		NOTES:
 		"""
 		#Stop threads
-		self.recorder.stop()
-		self.proc.stop()
+		self.pipeline.stop()
 
 		self.ui.run_button.setEnabled(True)
 		self.ui.stop_button.setEnabled(False)
 
 	############################################################################
-	def update_thread_run(self):
+	def show_timing(self, timing):
 		"""
-		PURPOSE: constantly updates the output values on the GUI
-		ARGS: none
+		PURPOSE: shows the processor stage and plot frame times and queue 
+			counters in the status bar
+		ARGS:
+			timing (dict): stage statistics from the processor status and the
+				plot renderer
 		RETURNS: none
 		NOTES:
 		"""
-		#Indicate thread is running
-		self.update_keep_going.set()
-		self.saver.start()
+		parts = []
+		for name in timing:
+			parts.append("%s %.0f/%.0f us" % (name, timing[name]["mean_us"], timing[name]["max_us"]))
+		for name, q in [("record", self.record_q), ("save", self.save_q)]:
+			q_status = q.get_status()
+			parts.append("%s_q %d skipped/%d overrun" % (name, q_status["skipped"], q_status["overruns"]))
+		q_status = self.res_q.get_status()
+		parts.append("%d stale frames" % (q_status["dropped"] + self.stale_frames))
+		self.ui.statusbar.showMessage("Mean/max: " + ", ".join(parts))
 
+	############################################################################
+	def poll_status(self):
+		"""
+		PURPOSE: shows the status of the threads, once a second
+		ARGS: none
+		RETURNS: none
+		NOTES: runs in the GUI thread from 'status_timer'
+		"""
 		try:
-			#Run until we are told to stop
-			prev_thread_poll_time = 0
-			prev_res_time = 0
-			while self.update_keep_going.is_set():
-				cur_time = time.time()
-				if (cur_time - prev_thread_poll_time) >= 1:
-					rec_status = self.recorder.get_status()
-					proc_status = self.proc.get_status()
-					rec_running = rec_status.get("running", False)
-					proc_running = proc_status.get("running", False)
-					if rec_running and proc_running:
-						ard_con = rec_status.get("connected", False)
-						recv_data = rec_status.get("receiving_data", False)
-						if recv_data and ard_con:
-							self.ui.recv_data_lbl.setText("Yes")
-						else:
-							self.ui.recv_data_lbl.setText("No")
-						if ard_con:
-							self.ui.ard_con_lbl.setText("Yes")
-						else:
-							self.ui.ard_con_lbl.setText("No")
-						self.ui.run_lbl.setText("Yes")
-					else:
-						self.ui.ard_con_lbl.setText("No")
-						self.ui.recv_data_lbl.setText("No")
-						self.ui.run_lbl.setText("No")
-						if proc_running != rec_running:
-							self.stop_button_clicked()
-					prev_thread_poll_time = cur_time
-				if (cur_time - prev_res_time) >= 0.1:
-					try:
-						sig = self.res_q.get(timeout=0.1)
-						ax = self.ui.disp_plot.canvas.ax
-						ax.clear()
-						ax.plot(sig["x"], sig["y"])
-						ax.set_xlabel(sig["xlabel"])
-						ax.set_ylabel(sig["ylabel"])
-						ax.set_title(sig["title"])
-						ax.set_xlim(sig["xlim"][0], sig["xlim"][1])
-						ax.set_ylim(sig["ylim"][0], sig["ylim"][1])
-						self.ui.disp_plot.canvas.draw()
-						self.ui.cpi_num_lbl.setText(str(sig["cpi_num"]))
-						self.ui.eng_lbl.setText("%.4f" % (sig["eng"]))
-						self.ui.detc_lbl.setText(str(sig["detc"]))
-						self.ui.vel_lbl.setText("%.2f" % sig["vel"])
-					except queue.Empty as e:
-						pass
-					prev_res_time = cur_time
-				time.sleep(0.1)
+			rec_status = self.recorder.get_status()
+			proc_status = self.proc.get_status()
+			rec_running = rec_status.get("running", False)
+			proc_running = proc_status.get("running", False)
+			if rec_running and proc_running:
+				ard_con = rec_status.get("connected", False)
+				recv_data = rec_status.get("receiving_data", False)
+				if recv_data and ard_con:
+					self.ui.recv_data_lbl.setText("Yes")
+				else:
+					self.ui.recv_data_lbl.setText("No")
+				if ard_con:
+					self.ui.ard_con_lbl.setText("Yes")
+				else:
+					self.ui.ard_con_lbl.setText("No")
+				self.ui.run_lbl.setText("Yes")
+				if "timing" in proc_status:
+					timing = proc_status["timing"]
+					timing.update(self.render_timer.get_stats())
+					self.show_timing(timing)
+			else:
+				self.ui.ard_con_lbl.setText("No")
+				self.ui.recv_data_lbl.setText("No")
+				self.ui.run_lbl.setText("No")
+				if rec_status.get("error"):
+					self.ui.statusbar.showMessage("ERROR: " + rec_status["error"])
+				if proc_running != rec_running:
+					self.stop_button_clicked()
 		except Exception as e:
-			print("ERROR: 'update_thread' got exception %s" % type(e))
+			print("ERROR: 'poll_status' got exception %s" % type(e))
 			print(e)
-			self.update_keep_going.clear()
 
-		#Cleanup
-		self.recorder.stop()
-		self.proc.stop()
-		self.saver.stop()
+	############################################################################
+	def refresh_display(self):
+		"""
+		PURPOSE: shows the newest result
+		ARGS: none
+		RETURNS: none
+		NOTES: runs in the GUI thread from 'refresh_timer'. Older results
+			still waiting are skipped and counted as stale
+		"""
+		try:
+			sig = None
+			while True:
+				try:
+					newer = self.res_q.get_nowait()
+				except queue.Empty as e:
+					break
+				if sig != None:
+					sig.release()
+					self.stale_frames += 1
+				sig = newer
+			if sig == None:
+				return
+			self.renderer.draw(sig)
+			self.ui.cpi_num_lbl.setText(str(sig["cpi_num"]))
+			self.ui.eng_lbl.setText("%.4f" % (sig["eng"]))
+			self.ui.detc_lbl.setText(str(sig["detc"]))
+			self.ui.vel_lbl.setText("%.2f" % sig["vel"])
+			sig.release()
+		except Exception as e:
+			print("ERROR: 'refresh_display' got exception %s" % type(e))
+			print(e)
 
 	############################################################################
 
@@ -232,8 +281,29 @@ if __name__ == "__main__":
 
 	parser = argparse.ArgumentParser(description="Speed Gun")
 	parser.add_argument("savefile", type=str, help="File to save to")
+	parser.add_argument("-t", "--ts_us", type=int, help="Sampling period (us)", default=200)
+	parser.add_argument("-c", "--cpi_samps", type=int, help="Samples per CPI", default=2500)
+	parser.add_argument("-b", "--baud", type=int, help="Serial baud rate", default=115200)
+	parser.add_argument("-s", "--ser_port", type=str, help="Serial port to listen on", default=None)
 	parser.add_argument("-e", "--emulate", help="Emulate recording", action="store_true", default=False)
+	parser.add_argument("--hop_ms", type=float, help="Time between overlapping CPIs (ms)", default=None)
+	parser.add_argument("--fft", type=str, help="FFT backend (numpy, scipy, fftw)", default="numpy")
+	parser.add_argument("--fft_workers", type=int, help="Threads per FFT", default=1)
+	parser.add_argument("--timing", help="Show processing stage times", action="store_true", default=False)
+	parser.add_argument("--replay_rate", type=float, help="Playback speed when emulating (x real time)", default=1.0)
+	parser.add_argument("--queue_size", type=int, help="Most chunks waiting to be processed", default=16)
+	parser.add_argument("--bus_chunks", type=int, help="Chunks kept for the processor and saver", default=64)
+	parser.add_argument("--refresh_hz", type=float, help="Display refresh rate (Hz)", default=20)
+	parser.add_argument("--map_cpis", type=int, help="CPIs shown in the Doppler map", default=200)
+	parser.add_argument("--full_res", help="Plot every sample or FFT bin", action="store_true", default=False)
+	parser.add_argument("--raw_counts", help="Keep and save raw ADC counts", action="store_true", default=False)
 	args = parser.parse_args()
 
-	speed_gun = Speed_Gun(200, 2500, args.savefile, emulate=args.emulate)
+	hop_samps = None
+	if args.hop_ms != None:
+		hop_samps = int(round(args.hop_ms * 1e3 / args.ts_us))
+	speed_gun = Speed_Gun(args.ts_us, args.cpi_samps, args.savefile, emulate=args.emulate, hop_samps=hop_samps, 
+		fft_backend=args.fft, fft_workers=args.fft_workers, timing=args.timing, 
+		replay_rate=args.replay_rate, raw_counts=args.raw_counts, baud=args.baud, ser_port=args.ser_port, 
+		queue_size=args.queue_size, bus_chunks=args.bus_chunks, refresh_hz=args.refresh_hz, map_cpis=args.map_cpis, full_res=args.full_res)
 	speed_gun.run_app()
@@ -0,0 +1,275 @@
+#Imports
+import threading
+import queue
+import time
+from Pipeline import Pipeline
+from Bounded_Queue import Bounded_Queue, NEVER_DROP
+
+#Modules the service must start without
+HEAVY_MODULES = ["PyQt5", "matplotlib", "scipy", "mplwidget", "UI"]
+
+################################################################################
+class Speed_Gun_Service:
+	"""
+	Runs the speed gun without a display, printing each detection
+	"""
+	def __init__(self, samp_T_us, cpi_samps, savefile, replay_file=None, hop_samps=None, fft_backend="numpy", fft_workers=1, replay_rate=1.0, replay_loops=None, raw_counts=False, baud=115200, ser_port=None, queue_size=16, bus_chunks=64, status_s=None):
+		"""
+		PURPOSE: creates a new Speed_Gun_Service
+		ARGS:
+			samp_T_us (float): sampling period in microseconds
+			cpi_samps (int): number of samples in one cpi
+			savefile (str): the file to save to
+			replay_file (str): recording to replay instead of reading the
+				arduino, if None reads the arduino
+			hop_samps (int): number of samples between overlapping cpis, if
+				None cpis do not overlap
+			fft_backend (str): fft library the processor uses
+			fft_workers (int): number of threads per fft
+			replay_rate (float): playback speed when replaying, as a multiple
+				of real time
+			replay_loops (int): number of times to replay the recording, if
+				None loops forever
+			raw_counts (bool): if True the arduino chunks stay as raw adc
+				counts, so they are saved as uint16
+			baud (int): baud rate to ask the arduino for
+			ser_port (str): serial port the arduino (or Arduino_Emulator) is
+				on, will try to find arduino if left as None
+			queue_size (int): most chunks waiting to be processed, the oldest
+				are dropped when processing falls behind
+			bus_chunks (int): number of chunks kept for the processor and
+				saver to read
+			status_s (float): seconds between status lines, None for none
+		RETURNS: new instance of a Speed_Gun_Service
+		NOTES: nothing to do with Qt or matplotlib is imported
+		"""
+		#Save arguments
+		self.status_s = status_s
+
+		#Setup thread variables first so a pipeline that fails to start
+		#cleans up
+		self.service_thread = None
+		self.service_keep_going = threading.Event()
+		self.service_keep_going.clear()
+
+		#Every result is read so no detection is missed, the processor's
+		#result pool bounds how many can wait
+		self.res_q = Bounded_Queue(policy=NEVER_DROP)
+		self.pipeline = Pipeline(samp_T_us, cpi_samps, savefile, self.res_q, replay_file=replay_file, hop_samps=hop_samps,
+			to_plot="none", fft_backend=fft_backend, fft_workers=fft_workers, replay_rate=replay_rate,
+			replay_loops=replay_loops, raw_counts=raw_counts, baud=baud, ser_port=ser_port, queue_size=queue_size,
+			bus_chunks=bus_chunks)
+
+		#Status variables
+		self.cpis = 0
+		self.detections = 0
+
+	############################################################################
+	def __del__(self):
+		"""
+		PURPOSE: performs any necessary cleanup
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.stop()
+
+	############################################################################
+	def start(self):
+		"""
+		PURPOSE: starts the pipeline and the thread reading its results
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		if self.service_thread == None or not self.is_running():
+			self.pipeline.start_saver()
+			self.pipeline.start()
+			self.service_thread = threading.Thread(target = self.run)
+			self.service_thread.start()
+
+	############################################################################
+	def stop(self):
+		"""
+		PURPOSE: stops the pipeline and the result thread
+		ARGS: none
+		RETURNS: none
+		NOTES: blocks until the threads stop
+		"""
+		if self.service_thread:
+			self.pipeline.close()
+			self.service_keep_going.clear()
+			self.service_thread.join()
+			self.service_thread = None
+
+	############################################################################
+	def is_running(self):
+		"""
+		PURPOSE: checks if the result thread is running
+		ARGS: none
+		RETURNS: True if running, False if stopped
+		NOTES:
+		"""
+		return self.service_keep_going.is_set()
+
+	############################################################################
+	def get_status(self):
+		"""
+		PURPOSE: gets the status of this thread
+		ARGS: none
+		RETURNS: dictionary of statuses
+		NOTES: 'pipeline' holds the status of every pipeline thread
+		"""
+		status = {
+			"running" : self.is_running(),
+			"cpis" : self.cpis,
+			"detections" : self.detections,
+			"pipeline" : self.pipeline.get_status()
+		}
+		return status
+
+	############################################################################
+	def print_status(self):
+		"""
+		PURPOSE: prints a one line summary of the pipeline
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		status = self.pipeline.get_status()
+		proc_q = status["bus"]["proc"]
+		save_q = status["bus"]["save"]
+		print("%s status: %d CPIs, %d detections, record_q %d skipped/%d overrun, save_q %d skipped/%d overrun, %d results dropped" % (
+			time.strftime("%H:%M:%S"), self.cpis, self.detections, proc_q["skipped"], proc_q["overruns"],
+			save_q["skipped"], save_q["overruns"], status["proc"]["res_dropped"]))
+
+	############################################################################
+	def run(self):
+		"""
+		PURPOSE: reads the results and prints the detections
+		ARGS: none
+		RETURNS: none
+		NOTES: calling 'start' runs this in a separate thread
+		"""
+		#Indicate thread is running
+		self.service_keep_going.set()
+
+		try:
+			status_time = time.time()
+			while self.is_running():
+				if self.status_s and time.time() - status_time >= self.status_s:
+					status_time = time.time()
+					self.print_status()
+				try:
+					res = self.res_q.get(timeout=0.1)
+				except queue.Empty as e:
+					continue
+				self.cpis += 1
+				if res.detc:
+					self.detections += 1
+					print("%s CPI = %d, Energy = %.4f, Velocity = %.2f mph" % (time.strftime("%H:%M:%S"), res.cpi_num, res.eng, res.vel))
+				res.release()
+		except Exception as e:
+			print("ERROR: 'service thread' got exception %s" % type(e))
+			print(e)
+			self.service_keep_going.clear()
+
+		self.service_keep_going.clear()
+
+################################################################################
+def check_startup(budget_s, runs=3):
+	"""
+	PURPOSE: measures how long the service takes to start in a new
+		interpreter
+	ARGS:
+		budget_s (float): most seconds allowed
+		runs (int): number of times to start, the fastest is used
+	RETURNS: True if it started within budget without any heavy modules
+	NOTES: times the interpreter, the imports and setting up a processor,
+		which is everything before the first chunk that is not i/o
+	"""
+	import os
+	import sys
+	import subprocess
+
+	code = ("import sys, time; t = time.perf_counter(); import Speed_Gun_Service; from Processor import Processor; "
+		"Processor(200, 2500, None, None, to_plot='none', real_fft=True); print(time.perf_counter() - t); "
+		"print(' '.join(sorted(m for m in sys.modules if m.split('.')[0] in Speed_Gun_Service.HEAVY_MODULES)))")
+	times = []
+	for ii in range(runs):
+		start_time = time.perf_counter()
+		out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+			stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.split("\n")
+		times.append((time.perf_counter() - start_time, float(out[0])))
+		heavy = out[1].split()
+	total_s, import_s = min(times)
+	ok = total_s <= budget_s and not heavy
+	print("Startup %.3f s (imports and setup %.3f s), budget %.3f s: %s" % (total_s, import_s, budget_s, "OK" if ok else "FAIL"))
+	if heavy:
+		print("Heavy modules imported: %s" % ", ".join(heavy))
+	return ok
+
+################################################################################
+if __name__ == "__main__":
+	import argparse
+	import sys
+
+	parser = argparse.ArgumentParser(description="Speed Gun without a display, prints each detection")
+	parser.add_argument("savefile", type=str, nargs="?", help="File to save to", default=None)
+	parser.add_argument("-t", "--ts_us", type=int, help="Sampling period (us)", default=200)
+	parser.add_argument("-c", "--cpi_samps", type=int, help="Samples per CPI", default=2500)
+	parser.add_argument("-b", "--baud", type=int, help="Serial baud rate", default=115200)
+	parser.add_argument("-s", "--ser_port", type=str, help="Serial port to listen on", default=None)
+	parser.add_argument("-r", "--replay", type=str, help="Recording to replay instead of the arduino", default=None)
+	parser.add_argument("--replay_rate", type=float, help="Playback speed when replaying (x real time)", default=1.0)
+	parser.add_argument("--loops", type=int, help="Times to replay the recording, forever if not given", default=None)
+	parser.add_argument("--hop_ms", type=float, help="Time between overlapping CPIs (ms)", default=None)
+	parser.add_argument("--fft", type=str, help="FFT backend (numpy, scipy, fftw)", default="numpy")
+	parser.add_argument("--fft_workers", type=int, help="Threads per FFT", default=1)
+	parser.add_argument("--queue_size", type=int, help="Most chunks waiting to be processed", default=16)
+	parser.add_argument("--bus_chunks", type=int, help="Chunks kept for the processor and saver", default=64)
+	parser.add_argument("--raw_counts", help="Keep and save raw ADC counts", action="store_true", default=False)
+	parser.add_argument("--status_s", type=float, help="Seconds between status lines", default=10)
+	parser.add_argument("--check_startup", help="Check the startup time is within budget and exit", action="store_true", default=False)
+	parser.add_argument("--startup_budget", type=float, help="Startup time budget (s)", default=1.0)
+	args = parser.parse_args()
+
+	if args.check_startup:
+		sys.exit(0 if check_startup(args.startup_budget) else 1)
+	if args.savefile == None:
+		parser.error("the savefile is required")
+
+	hop_samps = None
+	if args.hop_ms != None:
+		hop_samps = int(round(args.hop_ms * 1e3 / args.ts_us))
+	service = Speed_Gun_Service(args.ts_us, args.cpi_samps, args.savefile, replay_file=args.replay, hop_samps=hop_samps,
+		fft_backend=args.fft, fft_workers=args.fft_workers, replay_rate=args.replay_rate, replay_loops=args.loops,
+		raw_counts=args.raw_counts, baud=args.baud, ser_port=args.ser_port, queue_size=args.queue_size,
+		bus_chunks=args.bus_chunks, status_s=args.status_s)
+	service.start()
+	failed = False
+	try:
+		#Replays end on their own, the arduino runs until interrupted
+		while service.is_running() and service.pipeline.is_running():
+			time.sleep(0.5)
+		#Let the processor finish what is waiting, unless it has died
+		while service.is_running() and service.pipeline.proc.is_running() and (service.pipeline.record_q.qsize() or service.res_q.qsize()):
+			time.sleep(0.1)
+		failed = not (service.is_running() and service.pipeline.proc.is_running())
+	except KeyboardInterrupt as e:
+		pass
+	service.stop()
+	service.print_status()
+	if failed:
+		print("ERROR: the processor or service thread stopped early")
+	#Replays just end, the arduino only stops on an error
+	rec_error = service.pipeline.recorder.get_status().get("error")
+	if rec_error:
+		print("ERROR: the recorder stopped, %s" % rec_error)
+	#Every chunk must reach the save file
+	save_q = service.pipeline.save_q.get_status()
+	lost_chunks = save_q["skipped"] + save_q["overruns"]
+	if lost_chunks > 0:
+		print("ERROR: the saver lost %d chunks (%d samples)" % (lost_chunks, lost_chunks * args.cpi_samps))
+	if failed or rec_error or lost_chunks > 0:
+		sys.exit(1)
@@ -0,0 +1,138 @@
+#Imports
+import time
+import numpy as np
+
+################################################################################
+class Stage_Timer:
+	"""
+	Keeps cheap running statistics of how long each processing stage takes
+	"""
+	def __init__(self, alpha=0.05, num_bins=24, keep_samples=False):
+		"""
+		PURPOSE: creates a new Stage_Timer
+		ARGS:
+			alpha (float): weight of the newest sample in the moving average
+			num_bins (int): number of histogram bins, bin k counts durations
+				from 2**(k-1) up to 2**k microseconds
+			keep_samples (bool): if True every duration is kept so exact
+				percentiles can be computed, memory grows with each sample
+				so this is for benchmarks
+		RETURNS: new instance of a Stage_Timer
+		NOTES:
+		"""
+		self.alpha = alpha
+		self.num_bins = int(num_bins)
+		self.keep_samples = keep_samples
+		self.stats = {}
+		self.samples = {}
+		self.prev_times = {}
+
+	############################################################################
+	def record(self, name, dur):
+		"""
+		PURPOSE: adds one duration to a stage's statistics
+		ARGS:
+			name (str): name of the stage
+			dur (float): duration (seconds)
+		RETURNS: none
+		NOTES:
+		"""
+		dur_us = dur * 1e6
+		stat = self.stats.get(name)
+		if stat == None:
+			stat = {"count": 0, "last_us": 0.0, "mean_us": dur_us, "max_us": 0.0, "hist": [0] * self.num_bins}
+			self.stats[name] = stat
+		stat["count"] += 1
+		stat["last_us"] = dur_us
+		stat["mean_us"] += self.alpha * (dur_us - stat["mean_us"])
+		if dur_us > stat["max_us"]:
+			stat["max_us"] = dur_us
+		stat["hist"][min(int(dur_us).bit_length(), self.num_bins - 1)] += 1
+		if self.keep_samples:
+			self.samples.setdefault(name, []).append(dur_us)
+
+	############################################################################
+	def mark(self, name, start_time):
+		"""
+		PURPOSE: records the time since start_time for a stage
+		ARGS:
+			name (str): name of the stage
+			start_time (float): time.perf_counter() when the stage started
+		RETURNS: (float) current time.perf_counter(), to start the next stage
+		NOTES:
+		"""
+		now = time.perf_counter()
+		self.record(name, now - start_time)
+		return now
+
+	############################################################################
+	def interval(self, name):
+		"""
+		PURPOSE: records the time since this was last called with the same name
+		ARGS:
+			name (str): name of the event
+		RETURNS: none
+		NOTES: used for inter-arrival times
+		"""
+		now = time.perf_counter()
+		prev_time = self.prev_times.get(name)
+		if prev_time != None:
+			self.record(name, now - prev_time)
+		self.prev_times[name] = now
+
+	############################################################################
+	def reset(self):
+		"""
+		PURPOSE: clears all statistics
+		ARGS: none
+		RETURNS: none
+		NOTES:
+		"""
+		self.stats = {}
+		self.samples = {}
+		self.prev_times = {}
+
+	############################################################################
+	def get_stats(self):
+		"""
+		PURPOSE: gets a copy of the statistics of every stage
+		ARGS: none
+		RETURNS: dictionary keyed by stage name of dictionaries with count,
+			last_us, mean_us (moving average), max_us and hist
+		NOTES:
+		"""
+		stats = {}
+		for name in list(self.stats):
+			stat = dict(self.stats[name])
+			stat["hist"] = list(stat["hist"])
+			stats[name] = stat
+		return stats
+
+	############################################################################
+	def get_percentiles(self, name):
+		"""
+		PURPOSE: summarizes the durations of one stage
+		ARGS:
+			name (str): name of the stage
+		RETURNS: dictionary with count, mean_us, p50_us, p90_us, p99_us and
+			max_us, empty if the stage was never recorded
+		NOTES: exact if keep_samples is set, otherwise the percentiles are
+			the upper edge of their histogram bin and the mean is the
+			moving average
+		"""
+		stat = self.stats.get(name)
+		if stat == None:
+			return {}
+		res = {"count": stat["count"], "mean_us": stat["mean_us"], "max_us": stat["max_us"]}
+		samples = self.samples.get(name)
+		if samples:
+			samples = np.array(samples)
+			res["mean_us"] = float(np.mean(samples))
+			for pct in [50, 90, 99]:
+				res["p%d_us" % pct] = float(np.percentile(samples, pct))
+		else:
+			cum = np.cumsum(stat["hist"])
+			for pct in [50, 90, 99]:
+				k = int(np.searchsorted(cum, cum[-1] * pct / 100.0))
+				res["p%d_us" % pct] = min(float(2 ** k), stat["max_us"])
+		return res
@@ -117,6 +117,10 @@ class Ui_MainWindow(object):
         self.vel_radbutton.setMaximumSize(QtCore.QSize(16777215, 28))
         self.vel_radbutton.setObjectName("vel_radbutton")
         self.gridLayout.addWidget(self.vel_radbutton, 10, 1, 1, 2)
+        self.map_radbutton = QtWidgets.QRadioButton(self.centralwidget)
+        self.map_radbutton.setMaximumSize(QtCore.QSize(16777215, 28))
+        self.map_radbutton.setObjectName("map_radbutton")
+        self.gridLayout.addWidget(self.map_radbutton, 11, 0, 1, 1)
         self.horizontalLayout.addLayout(self.gridLayout)
         self.disp_plot = MplWidget(self.centralwidget)
         self.disp_plot.setMinimumSize(QtCore.QSize(680, 560))
@@ -166,6 +170,7 @@ class Ui_MainWindow(object):
         self.cpi_num_lbl.setText(_translate("MainWindow", "0"))
         self.raw_sig_radbutton.setText(_translate("MainWindow", "Raw Signal"))
         self.vel_radbutton.setText(_translate("MainWindow", "Velocity"))
+        self.map_radbutton.setText(_translate("MainWindow", "Doppler Map"))
 
 from mplwidget import MplWidget
 